@@ -1,8 +1,7 @@
 # Libraries
 import argparse
-import pandas as pd
 import numpy as np
-from flask import Flask
+from flask import Flask, jsonify
 from datetime import datetime
 from datetime import timedelta
 from dash import Dash, html, Input, Output, State, ctx
@@ -10,11 +9,16 @@ from dash import Dash, html, Input, Output, State, ctx
 # Modules
 import layout
 import converter
+import cache
+import jobs
 from pipeline import Pipeline
 from visualization import Visualization
 
 # Constants
 from config import COL_VISUALISATION_PRODUCTION
+from config import ROLLUP_POINTS
+from config import FIGURE_CACHE_SIZE
+from config import TRAIN_WORKERS
 
 # Server conf
 server = Flask(__name__)
@@ -41,6 +45,29 @@ pip = Pipeline()
 pip.data_process()
 pip.build_models()
 
+# Background jobs, run without blocking the callbacks
+background = jobs.JobQueue(name="training")
+
+# Cache of the figures, shared by the users
+figures = cache.LRUCache(max_size=FIGURE_CACHE_SIZE, name="figures")
+
+def get_figure_key(callback, *args):
+    """Key of a figure in the cache : callback, version of the dataset and normalized arguments
+
+    Args:
+        callback (str): name of the callback
+        args (list): arguments of the figure
+
+    Returns:
+        tuple: key
+    """
+    return (callback, pip.version) + tuple(str(converter.date(arg)) for arg in args)
+
+@server.route("/cache-stats")
+def cache_stats():
+    """Counters of the figures cache"""
+    return jsonify(figures.stats())
+
 @app.callback(
     [
         Output('predictions-graph', 'figure'),
@@ -171,15 +198,25 @@ def update_repartions(hoverData, date):
     # If the cursor if over the production graph, we 
     if hoverData:
         date = hoverData['points'][0]['x']
+
+    # The figure is built once for each date and version of the dataset
+    return figures.get_or_set(get_figure_key("repartitions", date), lambda: build_repartitions(date))
+
+def build_repartitions(date):
+    """Build the repartition figure of a date
+
+    Args:
+        date (str): date
+
+    Returns:
+        go.Figure: repartition figure
+    """
     
     # Get the data according to the date and the columns to visualize
     df = pip.data_serve(date=date, columns=COL_VISUALISATION_PRODUCTION)
 
-    # Melt the dataframe 
-    df = pd.melt(df, ignore_index=True, value_vars=df.columns)
-
     # Represent the data as a pie figure
-    fig_repartitions = vis.to_go_figure(vis.px_pie(names=df.variable, values=df.value))
+    fig_repartitions = vis.to_go_figure(vis.go_pie(labels=df.columns, values=df.sum(axis=0).values))
 
     # Return the go figure
     return vis.update_layout(
@@ -238,6 +275,39 @@ def update_models(_):
     # Return the options and select the first value by default
     return options, options[0].get("value")
 
+@app.callback(
+    Output('train-job', 'data'),
+    Output('train-interval', 'disabled'),
+    Output('train-status', 'children'),
+    Input('train-button', 'n_clicks'),
+    Input('train-interval', 'n_intervals'),
+    State('train-job', 'data'),
+    prevent_initial_call=True,
+)
+def update_training(_, __, job_id):
+    """Queue the training of the models in the background, then poll its status
+
+    Args:
+        job_id (str): id of the training job
+
+    Returns:
+        [str, bool, str]: id of the training job, polling disabled or not, status text
+    """
+
+    # The models are trained in worker processes, and swapped in when done
+    if ctx.triggered_id == "train-button":
+        job_id = background.submit("train", pip.train_models_parallel, workers=TRAIN_WORKERS)
+
+    job = background.get(job_id)
+
+    if job is None:
+        return job_id, True, ""
+
+    status_text = f"Training {job['status']} : {job['message']} ({job['progress']:.0%})"
+
+    # The polling stops when the job is over
+    return job_id, job["status"] in ("done", "failed"), status_text
+
 @app.callback(
     Output('productions-graph', 'figure'),
     [
@@ -258,25 +328,36 @@ def update_production(start, end, _):
         go.Figure: productions figure
     """
 
-    # Update the dataset if asked
+    # Update the dataset if asked : its version changes
     if ctx.triggered_id == "update-button":
-        pip.data_process(update=True, download=True, data_from="csv")
+        pip.data_process(update=True, download=True, data_from="csv", incremental=True)
 
-    # Get the data according to the date and the columns to visualize
-    df = pip.data_serve(start=start, end=end, columns=COL_VISUALISATION_PRODUCTION)
+    # The figure is built once for each range of dates and version of the dataset
+    return figures.get_or_set(get_figure_key("production", start, end), lambda: build_production(start, end))
+
+def build_production(start, end):
+    """Build the production figure of a range of dates
+
+    Args:
+        start (str): start date
+        end (str): end date
 
-    # Melt the dataframe 
-    df = pd.melt(df, ignore_index=False, value_vars=df.columns)
+    Returns:
+        go.Figure: productions figure
+    """
+
+    # Get the data according to the date and the columns to visualize
+    df = pip.data_serve(start=start, end=end, columns=COL_VISUALISATION_PRODUCTION, points=ROLLUP_POINTS)
 
-    # Represent the data as a lines figure
-    fig_production = vis.to_go_figure(vis.px_lines(x=df.index, y=df.value, color=df.variable))
+    # Represent the data as a lines figure : one line per column, downsampled to the budget of points
+    fig_production = vis.to_go_figure(vis.go_lines_columns(df))
 
-    # Return the figure
+    # Return the figure, the dates being sent as epoch milliseconds
     return vis.update_layout(
         fig_production,
         xaxis_title=None,
         yaxis_title="Power production by category [MW]",
-        )
+        ).update_xaxes(type="date")
 
 @app.callback(
     [
@@ -0,0 +1,178 @@
+# Libraries
+import sys
+import threading
+import logging
+import numpy as np
+from collections import OrderedDict
+
+logger = logging.getLogger("journal")
+
+def get_size(value):
+    """Estimate the size in memory of a value : arrays, dataframes, figures and their containers
+
+    Args:
+        value (object): value
+
+    Returns:
+        int: size in bytes
+    """
+
+    # Figures are measured through their dictionary of data and layout
+    if hasattr(value, "to_plotly_json"):
+        return get_size(value.to_plotly_json())
+
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+
+    if hasattr(value, "memory_usage") and hasattr(value, "index"):
+        return int(np.sum(value.memory_usage(index=True, deep=True)))
+
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(get_size(key) + get_size(item) for key, item in value.items())
+
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(get_size(item) for item in value)
+
+    return sys.getsizeof(value)
+
+class LRUCache():
+    """Cache of the last values used, bounded by their size in memory
+
+    When the values exceed max_size, the least recently used ones are evicted. The hits, the
+    misses and the evictions are counted. The cache can be shared by several threads.
+
+    Args:
+        max_size (int): maximal size of the values, in bytes
+        name (str, optional): name of the cache in the logs. Defaults to "cache".
+    """
+    def __init__(self, max_size, name="cache"):
+
+        self.max_size = max_size
+        self.name = name
+
+        self.items = OrderedDict()
+        self.size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Get the value of a key, and mark it as the most recently used
+
+        Args:
+            key (hashable): key
+            default (object, optional): value if the key is missing. Defaults to None.
+
+        Returns:
+            object: value
+        """
+
+        with self.lock:
+
+            if key not in self.items:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            self.items.move_to_end(key)
+
+            return self.items[key][0]
+
+    def set(self, key, value):
+        """Set the value of a key, then evict the least recently used values above max_size
+
+        A value larger than max_size is not kept.
+
+        Args:
+            key (hashable): key
+            value (object): value
+        """
+
+        size = get_size(value)
+
+        if size > self.max_size:
+            logger.debug(f"{self.name} : value of {size} bytes too large to be cached")
+            return
+
+        with self.lock:
+
+            if key in self.items:
+                self.size -= self.items.pop(key)[1]
+
+            self.items[key] = (value, size)
+            self.size += size
+
+            while self.size > self.max_size:
+                _, (_, evicted_size) = self.items.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def find(self, match):
+        """Get the first key matching a condition and its value, and mark it as the most recently used
+
+        Args:
+            match (callable): condition on the keys
+
+        Returns:
+            (hashable, object): key and value, (None, None) if no key matches
+        """
+
+        with self.lock:
+
+            for key in reversed(self.items):
+
+                if match(key):
+                    self.hits += 1
+                    self.items.move_to_end(key)
+                    return key, self.items[key][0]
+
+            self.misses += 1
+
+            return None, None
+
+    def get_or_set(self, key, build):
+        """Get the value of a key, or build it and cache it if missing
+
+        Args:
+            key (hashable): key
+            build (callable): function building the value
+
+        Returns:
+            object: value
+        """
+
+        missing = object()
+        value = self.get(key, default=missing)
+
+        if value is missing:
+            value = build()
+            self.set(key, value)
+
+        return value
+
+    def clear(self):
+        """Remove all the values"""
+
+        with self.lock:
+            self.items.clear()
+            self.size = 0
+
+    def stats(self):
+        """Get the counters of the cache
+
+        Returns:
+            dict: hits, misses, evictions, number of values and size in bytes
+        """
+
+        with self.lock:
+            return {
+                "hits" : self.hits,
+                "misses" : self.misses,
+                "evictions" : self.evictions,
+                "items" : len(self.items),
+                "size" : self.size,
+                "max_size" : self.max_size,
+            }
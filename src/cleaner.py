@@ -1,6 +1,7 @@
 # Libraries
 import pandas as pd
-import unidecode
+import numpy as np
+from datetime import datetime
 
 # Modules
 import selector
@@ -15,59 +16,335 @@ def clean_nan_rows(df, inplace=True):
 
     df.dropna(axis=0, how="any", inplace=inplace)
 
-def clean_power(df, columns=[], data_from="csv"):
+def align_hourly(dfs, dtype="float32"):
+    """Align datasets on a common hourly grid, in a single pass
 
-    if data_from == "csv":
-        df.index = pd.DatetimeIndex(pd.to_datetime(df.Date + " " +df.Heure))       
-        df.columns = [unidecode.unidecode(column.lower()).replace(" (mw)", "") for column in df.columns]
-        df = df.rename(columns={"prevision j-1": "prevision_j1"})
-        
-    elif data_from == "api":
-        df.index = pd.DatetimeIndex(pd.to_datetime(df.date + " " +df.heure))
+    Each column is linearly interpolated between its valid values, straight into a preallocated
+    block. As with a reindex followed by a linear interpolation, a column stays missing before
+    its first valid value and is held at its last valid value until the end of its dataset.
+    The rows containing any Nan are dropped.
 
-    df.index.name = "longdate"
+    Args:
+        dfs (list): datasets, each with a sorted DatetimeIndex
+        dtype (str, optional): dtype of the block. Defaults to "float32".
 
-    df = selector.get_columns(df, columns=columns)
-    df = df.groupby(pd.Grouper(axis=0, freq="H")).mean()
+    Returns:
+        pd.DataFrame: joined dataset
+    """
+
+    # The common grid is covered by all the datasets
+    start = max(df.index.min() for df in dfs)
+    end = min(df.index.max() for df in dfs)
+
+    grid = pd.date_range(start=start, end=end, freq="H", name="longdate")
+    grid_ns = grid.values.view("int64")
+
+    columns = [column for df in dfs for column in df.columns]
+    block = np.empty((len(grid), len(columns)), dtype=dtype)
+
+    position = 0
+
+    for df in dfs:
+
+        index_ns = df.index.values.view("int64")
+
+        for column in df.columns:
+
+            values = df[column].values
+            valid = ~np.isnan(values)
+
+            if valid.any():
+                block[:, position] = np.interp(grid_ns, index_ns[valid], values[valid])
+                block[grid_ns < index_ns[valid][0], position] = np.nan
+            else:
+                block[:, position] = np.nan
+
+            position += 1
+
+    keep = ~np.isnan(block).any(axis=1)
+
+    return pd.DataFrame(block[keep], index=grid[keep], columns=columns)
+
+def get_bin_start(date, freq):
+    """Get the start of the bin of a date
+
+    Args:
+        date (datetime): date
+        freq (str): frequency of the bins ("6H", "D", "W-MON", "MS"...)
+
+    Returns:
+        pd.Timestamp: start of the bin containing the date
+    """
+
+    offset = pd.tseries.frequencies.to_offset(freq)
+
+    # Fixed frequencies are floored, calendar ones are rolled back to their anchor
+    if isinstance(offset, pd.offsets.Tick):
+        return pd.Timestamp(date).floor(offset)
+
+    return offset.rollback(pd.Timestamp(date).normalize())
+
+def rollup(df, freq):
+    """Aggregate a dataset by bins of a coarser frequency
+
+    Each column gives its mean under the same name, and its minimum and maximum as
+    <column>_min and <column>_max. The bins are labelled by their start, the empty ones are dropped.
+
+    Args:
+        df (pd.DataFrame): dataset with a sorted DatetimeIndex
+        freq (str): frequency of the bins ("6H", "D", "W-MON", "MS"...)
+
+    Returns:
+        pd.DataFrame: aggregated dataset
+    """
+
+    resampled = df.resample(freq, closed="left", label="left")
+
+    df_rollup = pd.concat([
+        resampled.mean(),
+        resampled.min().add_suffix("_min"),
+        resampled.max().add_suffix("_max"),
+    ], axis=1)
+
+    df_rollup = df_rollup.dropna(axis=0, how="all")
+    df_rollup.index.name = "longdate"
+
+    return df_rollup
+
+def iter_chunks(df):
+    """Iterate over a dataframe as a single chunk, or over the chunks of a streamed file
+
+    Args:
+        df (pd.DataFrame, iterable): dataframe or iterable of dataframes
+
+    Returns:
+        iterable: chunks
+    """
+    return [df, ] if isinstance(df, pd.DataFrame) else df
+
+def partial_mean(df, by):
+    """Partial mean of a chunk : sums and counts of the numeric columns for each group
+
+    Args:
+        df (pd.DataFrame): chunk
+        by (array-like): keys of the groups
+
+    Returns:
+        (pd.DataFrame, pd.DataFrame): sums and counts
+    """
+
+    grouped = df.select_dtypes("number").groupby(by)
+
+    return grouped.sum().astype("float64"), grouped.count()
+
+def reduce_mean(partials, columns=[]):
+    """Reduce the partial means of all the chunks to the mean of each group
+
+    Args:
+        partials (list): list of (sums, counts) given by partial_mean
+        columns (list, optional): columns of the dataset, if there is no chunk. Defaults to [].
+
+    Returns:
+        pd.DataFrame: mean of each group, sorted by key
+    """
+
+    # A dataset without any record, as an empty export of the api
+    if not partials:
+        return pd.DataFrame(columns=columns, index=pd.DatetimeIndex([], name="longdate"), dtype="float64")
+
+    sums, counts = zip(*partials)
+
+    sums = pd.concat(sums).groupby(level=0).sum()
+    counts = pd.concat(counts).groupby(level=0).sum()
+
+    return sums / counts
+
+def parse_offsets(offsets):
+    """Parse UTC offsets (+01:00, -05:30, Z) to nanoseconds
+
+    Args:
+        offsets (array-like): offsets as strings
+
+    Returns:
+        np.array: offsets in nanoseconds, as int64
+    """
+
+    offsets = pd.Categorical(offsets)
+
+    minutes = [
+        0 if offset in ("", "Z") else (-1 if offset[0] == "-" else 1) * (int(offset[1:3]) * 60 + int(offset[4:6]))
+        for offset in offsets.categories
+    ]
+
+    return np.array(minutes + [0, ], dtype="int64")[offsets.codes] * 60 * 10**9
+
+def parse_dates(dates, date_format="%Y-%m-%d", utc=False):
+    """Parse dates from their unique values
+
+    With utc, each date is followed by its UTC offset (2020-01-01T01:00:00+01:00). The local date
+    is parsed with the fixed date_format, then the offset is subtracted on the int64 nanoseconds
+    to get naive UTC dates. Missing values give NaT.
+
+    Args:
+        dates (array-like): dates as strings or categories
+        date_format (str, optional): format of the dates, without the offset. Defaults to "%Y-%m-%d".
+        utc (bool, optional): convert the dates to UTC. Defaults to False.
+
+    Returns:
+        pd.DatetimeIndex: dates
+    """
+
+    dates = pd.Categorical(dates)
+    values = dates.categories.astype(str)
+
+    if utc:
+        # The formats are fixed width : the offset starts after the local date
+        width = len(datetime(2000, 1, 1).strftime(date_format))
+
+        parsed = pd.to_datetime(values.str[:width], format=date_format)
+        parsed = parsed.values.view("int64") - parse_offsets(values.str[width:])
+        parsed = parsed.view("datetime64[ns]")
+
+    else:
+        parsed = pd.to_datetime(values, format=date_format).values
+
+    # A NaT is appended so that the code -1 of the missing values points to it
+    parsed = np.append(parsed, np.datetime64("NaT", "ns"))
+
+    return pd.DatetimeIndex(parsed[dates.codes])
+
+def build_timestamps(dates, times, date_format="%Y-%m-%d", time_format="%H:%M"):
+    """Build timestamps from a date column and a time column
+
+    Only the unique dates and times are parsed, with fixed formats. The timestamps are then
+    combined arithmetically : date of the row + time of the row. Missing values give NaT.
+
+    Args:
+        dates (array-like): dates as strings or categories
+        times (array-like): times as strings or categories
+        date_format (str, optional): format of the dates. Defaults to "%Y-%m-%d".
+        time_format (str, optional): format of the times. Defaults to "%H:%M".
+
+    Returns:
+        pd.DatetimeIndex: timestamps
+    """
+
+    times = pd.Categorical(times)
+
+    # Parse the unique values only
+    hours = pd.to_datetime(times.categories.astype(str), format=time_format)
+    hours = hours - hours.normalize()
+
+    # A NaT is appended so that the code -1 of the missing values points to it
+    hours = np.append(hours.values, np.timedelta64("NaT", "ns"))
+
+    return pd.DatetimeIndex(parse_dates(dates, date_format=date_format).values + hours[times.codes])
+
+def clean_power(df, columns=[], data_from="csv", since=None):
+    """Clean the power dataset and average it by hour
+
+    The dataset can be given as a dataframe or as chunks, which are cleaned one at a time.
+
+    Args:
+        df (pd.DataFrame, iterable): dataset or its chunks
+        columns (list, optional): columns to keep. Defaults to [].
+        data_from (str, optional): "csv" or "api". Defaults to "csv".
+        since (datetime, optional): only keep the rows from this date. Defaults to None.
+
+    Returns:
+        pd.DataFrame: hourly dataset
+    """
+
+    partials = []
+
+    for chunk in iter_chunks(df):
+
+        chunk.index = build_timestamps(chunk.date, chunk.heure)
+        chunk.index.name = "longdate"
+
+        chunk = selector.get_columns(chunk, columns=columns)
+
+        if since:
+            chunk = chunk.iloc[chunk.index >= since]
+
+        partials.append(partial_mean(chunk, by=chunk.index.floor("H")))
+
+    df = reduce_mean(partials, columns=columns).asfreq("H")
+    df.index.name = "longdate"
 
     df = df.sort_index()
 
     return df
 
 
-def clean_weather(df, columns=[], data_from="csv"):
-    
-    if data_from == "csv":
-        df = df.groupby("Date").mean()
-        df.columns = ["code", "wspd", "sun"]
-        df.index.name = "longdate"
+def clean_weather(df, columns=[], data_from="csv", since=None):
+    """Clean the weather dataset and average it over the regions
+
+    The dataset can be given as a dataframe or as chunks, which are cleaned one at a time.
+    The dates are converted to naive UTC dates before grouping.
+
+    Args:
+        df (pd.DataFrame, iterable): dataset or its chunks
+        columns (list, optional): columns to keep. Defaults to [].
+        data_from (str, optional): "csv" or "api". Defaults to "csv".
+        since (datetime, optional): only keep the rows from this date. Defaults to None.
+
+    Returns:
+        pd.DataFrame: dataset
+    """
+
+    partials = []
+
+    for chunk in iter_chunks(df):
+
+        dates = parse_dates(chunk.date, date_format='%Y-%m-%dT%H:%M:%S', utc=True)
 
-    elif data_from == "api":        
-        df = df.groupby("date").mean()
-        df.columns = ["sun", "wspd"]
+        if since:
+            mask = dates >= since
+            chunk, dates = chunk.iloc[mask], dates[mask]
 
-    df.index = pd.DatetimeIndex(pd.to_datetime(df.index, format = '%Y-%m-%dT%H:%M:%S%z', utc=True).strftime('%Y-%m-%d %H:%M:%S'))
+        partials.append(partial_mean(chunk, by=dates))
+
+    df = reduce_mean(partials, columns=columns)
+    df.index.name = "longdate"
     df = selector.get_columns(df, columns=columns)
 
     df = df.sort_index()
 
     return df
-    
-    
-def clean_temp(df, columns=[], data_from="csv"):
-
-    
-    if data_from == "csv":
-        df = df.groupby("Date").mean()
-        df.columns = ["code", "tmin", "tmax", "tmoy"]
-        df.index = pd.DatetimeIndex(pd.to_datetime(df.index, format = '%Y-%m-%d').strftime('%Y-%m-%d %H:%M:%S'))
-    
-    elif data_from == "api":
-        df = df.groupby("date").mean()
 
+
+def clean_temp(df, columns=[], data_from="csv", since=None):
+    """Clean the temperature dataset and average it over the regions
+
+    The dataset can be given as a dataframe or as chunks, which are cleaned one at a time.
+
+    Args:
+        df (pd.DataFrame, iterable): dataset or its chunks
+        columns (list, optional): columns to keep. Defaults to [].
+        data_from (str, optional): "csv" or "api". Defaults to "csv".
+        since (datetime, optional): only keep the rows from this date. Defaults to None.
+
+    Returns:
+        pd.DataFrame: dataset
+    """
+
+    partials = []
+
+    for chunk in iter_chunks(df):
+
+        dates = parse_dates(chunk.date, date_format='%Y-%m-%d')
+
+        if since:
+            mask = dates >= since
+            chunk, dates = chunk.iloc[mask], dates[mask]
+
+        partials.append(partial_mean(chunk, by=dates))
+
+    df = reduce_mean(partials, columns=columns)
     df.index.name = "longdate"
     df = df.loc[:, columns]
 
     df = df.sort_index()
 
-    return df 
\ No newline at end of file
+    return df
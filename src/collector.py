@@ -1,55 +1,496 @@
 # Libraries
 import requests
 import json
+import hashlib
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import numpy as np
 import os
-import wget
+import unidecode
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pprint import pprint
 import logging
 
 logger = logging.getLogger("journal")
 
-def from_web(url, path, folder):
+def get_download_metadata(path):
+    """Load the validators (ETag, Last-Modified) stored after the last download of a file
+
+    Args:
+        path (Path): path of the downloaded file
+
+    Returns:
+        dict: metadata, empty if the file has never been downloaded
+    """
+
+    path_metadata = Path(f"{path}.json")
+
+    if not path_metadata.exists():
+        return {}
+
+    with open(path_metadata, "r") as f:
+        return json.load(f)
+
+def save_download_metadata(path, metadata):
+    """Save the validators of a downloaded file
+
+    Args:
+        path (Path): path of the downloaded file
+        metadata (dict): metadata
+    """
+
+    with open(Path(f"{path}.json"), "w") as f:
+        json.dump(metadata, f)
+
+def get_validators(response):
+    """Get the validators of a response
+
+    Args:
+        response (requests.Response): response
+
+    Returns:
+        dict: ETag and Last-Modified headers, if given
+    """
+    return {
+        "etag" : response.headers.get("ETag"),
+        "last_modified" : response.headers.get("Last-Modified"),
+    }
+
+def get_session(max_workers=1):
+    """Get a session whose connection pool is sized for concurrent requests
+
+    Args:
+        max_workers (int, optional): number of concurrent requests. Defaults to 1.
+
+    Returns:
+        requests.Session: session
+    """
+
+    session = requests.Session()
+
+    adapter = requests.adapters.HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    return session
+
+def from_web(url, path, session=None, chunk_size=1 << 20, timeout=(10, 60)):
     """Download a file from an url
 
+    * if the file was already downloaded, it is only transferred again if it changed (If-None-Match, If-Modified-Since)
+    * a partial download is resumed from where it stopped (Range, If-Range), or restarted if the range is refused
+    * the file is written to a .part file first, the previous copy is only replaced once the download is complete
+
     Args:
         url (str): url of the file
-        path (path): path of the file
-        folder (path): folder containing the file
+        path (Path): path of the file
+        session (requests.Session, optional): session used to pool the connections. Defaults to None.
+        chunk_size (int, optional): number of bytes written at once. Defaults to 1 MiB.
+        timeout (tuple, optional): connection and read timeouts in seconds. Defaults to (10, 60).
+
+    Returns:
+        bool: True if the file has been downloaded, False if it didn't change
     """
 
-    # If the path already exists, it is removed
+    path = Path(path)
+    path_part = Path(f"{path}.part")
+    session = session or requests
+
+    metadata = get_download_metadata(path)
+    headers = {}
+
+    # Conditional request if a good copy already exists
     if path.exists():
-        os.remove(path)
+        if metadata.get("etag"):
+            headers["If-None-Match"] = metadata.get("etag")
+        if metadata.get("last_modified"):
+            headers["If-Modified-Since"] = metadata.get("last_modified")
+
+    # Resume the partial download if it is still the same file
+    partial = metadata.get("partial", {})
+    validator = partial.get("etag") or partial.get("last_modified")
+    offset = path_part.stat().st_size if path_part.exists() else 0
+
+    if offset and validator:
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = validator
 
     logger.info(f"downloading from {url}...")
-    #Wget is used to download the file to the folder
-    wget.download(url, folder) 
 
-    logger.debug(f"file downloaded")
+    with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+
+        if response.status_code == 304:
+            logger.info(f"{path.name} didn't change since the last download")
+            return False
+
+        # The range can't be satisfied if the partial download was already complete : it is started again
+        if response.status_code == 416 and "Range" in headers:
+            logger.warning(f"range of {path.name} not satisfiable, restarting the download")
+
+            path_part.unlink()
+            metadata.pop("partial", None)
+            save_download_metadata(path, metadata)
+
+            return from_web(url, path, session=session, chunk_size=chunk_size, timeout=timeout)
+
+        response.raise_for_status()
+
+        # The server may ignore the range and send the whole file
+        resumed = response.status_code == 206 and offset and validator
+
+        if resumed:
+            logger.debug(f"download of {path.name} resumed at {offset} bytes")
+        else:
+            metadata["partial"] = get_validators(response)
+            save_download_metadata(path, metadata)
+
+        with open(path_part, "ab" if resumed else "wb") as f:
+            for block in response.iter_content(chunk_size=chunk_size):
+                f.write(block)
+
+        validators = get_validators(response) if not resumed else partial
+
+    # The previous copy is replaced by the complete download only
+    os.replace(path_part, path)
+    save_download_metadata(path, validators)
+
+    logger.debug(f"file downloaded to {path}")
+
+    return True
+
+def from_web_all(urls, paths, max_workers=3):
+    """Download multiple files concurrently
+
+    The downloads share a session, so that the connections to the server are pooled.
+    If a download fails, the others still run to their end before the first error is raised.
+
+    Args:
+        urls (list): urls of the files
+        paths (list): paths of the files
+        max_workers (int, optional): number of concurrent downloads. Defaults to 3.
+
+    Returns:
+        dict: path -> True if downloaded, False if it didn't change
+    """
+
+    downloaded = {}
+    errors = []
+
+    with get_session(max_workers) as session:
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+            futures = {
+                executor.submit(from_web, url, path, session=session): path
+                for url, path in zip(urls, paths)
+            }
+
+            for future in as_completed(futures):
+                path = futures[future]
+
+                try:
+                    downloaded[path] = future.result()
+
+                except Exception as exce:
+                    logger.error(f"unable to download {path} : {exce}")
+                    errors.append(exce)
+
+    if errors:
+        raise errors[0]
+
+    return downloaded
+
+
+def where_since(field, since):
+    """Build the where clause selecting the records from a given date
+
+    Args:
+        field (str): date field of the dataset
+        since (datetime): first date to select
+
+    Returns:
+        str: where clause
+    """
+    return f"{field} >= date'{since:%Y-%m-%d}'"
+
+def to_batch(records, schema):
+    """Build a typed columnar batch from json records
+
+    Args:
+        records (list): records as dicts
+        schema (dict): field -> (column, dtype)
+
+    Returns:
+        pd.DataFrame: batch
+    """
+    return pd.DataFrame({
+        name : pd.Series([record.get(field) for record in records], dtype=dtype)
+        for field, (name, dtype) in schema.items()
+    })
+
+def from_api(url, schema, where=None, order_by=None, page_size=10000, max_workers=4, timezone="Europe/Berlin", timeout=(10, 60)):
+    """Import a dataset from the opendatasoft v2 api
+
+    The number of records is requested first, then the records are exported by pages in parallel.
+    The pages are taken by offset : the records must be sorted on a unique key, given by order_by,
+    so that no record is skipped or exported twice. Each page is converted to a typed batch, the
+    batches are yielded as the chunks of a csv file.
+
+    Args:
+        url (str): url of the dataset, ending by /datasets/<dataset_id>
+        schema (dict): field -> (column, dtype)
+        where (str, optional): where clause to filter the records. Defaults to None.
+        order_by (str, optional): fields sorting the records, separated by commas. Defaults to None.
+        page_size (int, optional): number of records per page. Defaults to 10000.
+        max_workers (int, optional): number of pages requested at once. Defaults to 4.
+        timezone (str, optional): timezone of the dates. Defaults to "Europe/Berlin".
+        timeout (tuple, optional): connection and read timeouts in seconds. Defaults to (10, 60).
+
+    Yields:
+        pd.DataFrame: batches of the dataframe
+    """
+
+    params = {
+        "select" : ",".join(schema),
+        "timezone" : timezone,
+    }
+
+    if where:
+        params["where"] = where
+
+    if order_by:
+        params["order_by"] = order_by
+
+    with get_session(max_workers) as session:
+
+        # Number of records to export
+        response = session.get(f"{url}/records", params={**params, "limit" : 0}, timeout=timeout)
+        response.raise_for_status()
+        total_count = response.json().get("total_count", 0)
+
+        logger.info(f"exporting {total_count} records from {url}...")
 
+        if not total_count:
+            return
 
-def from_api(url_request):
-    pass
-    # TODO
-    # response_API = requests.get(url_request)
-    
-    # json_response = response_API.json()
+        def get_page(offset):
+            response = session.get(f"{url}/exports/json", params={**params, "limit" : page_size, "offset" : offset}, timeout=timeout)
+            response.raise_for_status()
+            return to_batch(response.json(), schema)
 
-    # df = pd.json_normalize(json_response)
-    # df.columns = df.columns.str.replace("record.fields.", "")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            yield from executor.map(get_page, range(0, total_count, page_size))
 
-    # return df
+        logger.debug(f"records exported from {url}")
 
 
-def from_csv(csv_path):
+def normalize_label(label):
+    """Normalize a column label so that accents, case and spaces don't matter
+
+    Args:
+        label (str): label of a column
+
+    Returns:
+        str: normalized label
+    """
+    return unidecode.unidecode(label).lower().strip()
+
+def from_csv(csv_path, schema=None, chunksize=None):
     """Import a csv file as pd.DataFrame
 
+    If a schema is given, only its source columns are read, typed and renamed.
+    If a chunksize is given, the file is streamed as an iterator of dataframes.
+
     Args:
         csv_path (Path): path of the csv file to read
+        schema (dict, optional): source column -> (column, dtype). Defaults to None.
+        chunksize (int, optional): number of rows per chunk. Defaults to None.
+
+    Returns:
+        pd.DataFrame or iterator: build dataframe or its chunks
+    """
+
+    if not schema:
+        return pd.read_csv(csv_path, delimiter=";", chunksize=chunksize)
+
+    # Match the labels of the schema with the labels of the header
+    header = pd.read_csv(csv_path, delimiter=";", nrows=0).columns
+    labels = {normalize_label(label): label for label in header}
+
+    names = {}
+    dtypes = {}
+    for source, (name, dtype) in schema.items():
+
+        label = labels.get(normalize_label(source))
+
+        if label is None:
+            raise KeyError(f"column {source} not found in {csv_path}")
+
+        names[label] = name
+        dtypes[label] = dtype
+
+    reader = pd.read_csv(csv_path, delimiter=";", usecols=list(names), dtype=dtypes, chunksize=chunksize)
+
+    logger.debug(f"reading {len(names)} columns from {csv_path}")
+
+    if chunksize is None:
+        return reader.rename(columns=names)
+
+    return (chunk.rename(columns=names) for chunk in reader)
+
+
+def file_digest(path, block_size=1 << 20):
+    """Hash the content of a file
+
+    Args:
+        path (Path): path of the file
+        block_size (int, optional): number of bytes read at once. Defaults to 1 MiB.
 
     Returns:
-        pd.DataFrame: build dataframe
+        str: hexadecimal digest
     """
-    return pd.read_csv(csv_path, delimiter=";")
 
+    digest = hashlib.sha1()
+
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+def get_cache_paths(csv_path, cache_folder):
+    """Paths of the cached columns of a csv file and of their metadata
+
+    Args:
+        csv_path (Path): path of the csv file
+        cache_folder (Path): folder of the cache
+
+    Returns:
+        (Path, Path): parquet file and metadata file
+    """
+
+    name = Path(csv_path).stem
+
+    return Path(cache_folder, f"{name}.parquet"), Path(cache_folder, f"{name}.json")
+
+def is_cached(csv_path, cache_folder, schema):
+    """Check if the cache of a csv file is still valid
+
+    The size and the modification time are checked first. If only the modification time
+    changed, the content is hashed again : a file downloaded again with the same content
+    keeps its cache.
+
+    Args:
+        csv_path (Path): path of the csv file
+        cache_folder (Path): folder of the cache
+        schema (dict): source column -> (column, dtype)
+
+    Returns:
+        bool: True if the cache can be used
+    """
+
+    path_parquet, path_metadata = get_cache_paths(csv_path, cache_folder)
+
+    if not (path_parquet.exists() and path_metadata.exists()):
+        return False
+
+    with open(path_metadata, "r") as f:
+        metadata = json.load(f)
+
+    stat = os.stat(csv_path)
+
+    # The cached columns depend on the schema
+    if metadata.get("schema") != json.loads(json.dumps(schema)):
+        return False
+
+    if metadata.get("size") != stat.st_size:
+        return False
+
+    if metadata.get("mtime") == stat.st_mtime_ns:
+        return True
+
+    if metadata.get("digest") != file_digest(csv_path):
+        return False
+
+    # Same content : only the modification time is updated
+    metadata["mtime"] = stat.st_mtime_ns
+
+    with open(path_metadata, "w") as f:
+        json.dump(metadata, f)
+
+    return True
+
+def to_cache(csv_path, cache_folder, schema, chunksize=200000, compression="zstd"):
+    """Convert the columns of a csv file given by the schema to a compressed parquet file
+
+    The csv file is streamed by chunks, each chunk being written as a row group.
+
+    Args:
+        csv_path (Path): path of the csv file
+        cache_folder (Path): folder of the cache
+        schema (dict): source column -> (column, dtype)
+        chunksize (int, optional): number of rows per chunk. Defaults to 200000.
+        compression (str, optional): parquet compression. Defaults to "zstd".
+    """
+
+    path_parquet, path_metadata = get_cache_paths(csv_path, cache_folder)
+    path_tmp = path_parquet.with_suffix(".tmp")
+
+    # Categories are stored as dictionary encoded strings
+    categories = [name for name, dtype in schema.values() if dtype == "category"]
+    arrow_schema = pa.schema([
+        (name, pa.string() if dtype == "category" else pa.from_numpy_dtype(np.dtype(dtype)))
+        for name, dtype in schema.values()
+    ])
+
+    stat = os.stat(csv_path)
+    digest = file_digest(csv_path)
+
+    logger.info(f"caching {csv_path}...")
+
+    with pq.ParquetWriter(path_tmp, arrow_schema, compression=compression) as writer:
+        for chunk in from_csv(csv_path, schema=schema, chunksize=chunksize):
+            chunk = chunk.astype({name: object for name in categories})
+            writer.write_table(pa.Table.from_pandas(chunk, schema=arrow_schema, preserve_index=False))
+
+    # The previous cache is only replaced by a complete one
+    os.replace(path_tmp, path_parquet)
+
+    with open(path_metadata, "w") as f:
+        json.dump({
+            "size" : stat.st_size,
+            "mtime" : stat.st_mtime_ns,
+            "digest" : digest,
+            "schema" : schema,
+        }, f)
+
+    logger.debug(f"{csv_path} cached to {path_parquet}")
+
+def from_cache(csv_path, cache_folder, schema, chunksize=200000):
+    """Import the columns of a csv file from its cache, built if necessary
+
+    The parquet file is memory-mapped and streamed by chunks, as from_csv does.
+
+    Args:
+        csv_path (Path): path of the csv file
+        cache_folder (Path): folder of the cache
+        schema (dict): source column -> (column, dtype)
+        chunksize (int, optional): number of rows per chunk. Defaults to 200000.
+
+    Returns:
+        iterator: chunks of the dataframe
+    """
+
+    if not is_cached(csv_path, cache_folder, schema):
+        to_cache(csv_path, cache_folder, schema, chunksize=chunksize)
+
+    path_parquet, _ = get_cache_paths(csv_path, cache_folder)
+
+    categories = [name for name, dtype in schema.values() if dtype == "category"]
+    parquet_file = pq.ParquetFile(path_parquet, memory_map=True, read_dictionary=categories)
+
+    logger.debug(f"reading {csv_path} from {path_parquet}")
+
+    return (batch.to_pandas() for batch in parquet_file.iter_batches(batch_size=chunksize))
@@ -4,6 +4,100 @@ COL_TEMP = ["tmin", "tmax", "tmoy"]
 COL_WEATHER = ["wspd", "sun"]
 COL_VISUALISATION_PRODUCTION = ["fioul", "charbon", "gaz", "nucleaire", "eolien", "solaire", "hydraulique", "pompage", "bioenergies"]
 
+# Schemas of the csv files : source column -> (column, dtype)
+SCHEMA_CSV_POWER = {
+    "Date" : ("date", "category"),
+    "Heure" : ("heure", "category"),
+    "Consommation (MW)" : ("consommation", "float32"),
+    "Prévision J-1 (MW)" : ("prevision_j1", "float32"),
+    "Fioul (MW)" : ("fioul", "float32"),
+    "Charbon (MW)" : ("charbon", "float32"),
+    "Gaz (MW)" : ("gaz", "float32"),
+    "Nucléaire (MW)" : ("nucleaire", "float32"),
+    "Eolien (MW)" : ("eolien", "float32"),
+    "Solaire (MW)" : ("solaire", "float32"),
+    "Hydraulique (MW)" : ("hydraulique", "float32"),
+    "Pompage (MW)" : ("pompage", "float32"),
+    "Bioénergies (MW)" : ("bioenergies", "float32"),
+}
+SCHEMA_CSV_TEMP = {
+    "Date" : ("date", "category"),
+    "TMin (°C)" : ("tmin", "float32"),
+    "TMax (°C)" : ("tmax", "float32"),
+    "TMoy (°C)" : ("tmoy", "float32"),
+}
+SCHEMA_CSV_WEATHER = {
+    "Date" : ("date", "category"),
+    "Vitesse du vent à 100m (m/s)" : ("wspd", "float32"),
+    "Rayonnement solaire global (W/m2)" : ("sun", "float32"),
+}
+
+# Schemas of the api datasets : field -> (column, dtype)
+SCHEMA_API_POWER = {
+    "date" : ("date", "category"),
+    "heure" : ("heure", "category"),
+    **{column : (column, "float32") for column in COL_POWER},
+}
+SCHEMA_API_TEMP = {
+    "date" : ("date", "category"),
+    **{column : (column, "float32") for column in COL_TEMP},
+}
+SCHEMA_API_WEATHER = {
+    "date" : ("date", "category"),
+    "uv100" : ("wspd", "float32"),
+    "ssrd03h" : ("sun", "float32"),
+}
+
+# Order of the records of the api datasets : the pages exported by offset must not overlap
+ORDER_API_POWER = "date,heure"
+ORDER_API_TEMP = "date,code_insee_region"
+ORDER_API_WEATHER = "date,code_insee_region"
+
+# Number of csv rows read, cleaned and aggregated at once
+CSV_CHUNKSIZE = 200000
+
+# Formats of the dates given by the dashboard, tried in order
+DATE_FORMATS = [
+    "%Y-%m-%d %H:%M",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%d",
+    "%Y-%m-%dT%H:%M",
+    "%Y-%m-%d %H:%M:%S.%f",
+    "%Y-%m-%dT%H:%M:%S.%f",
+]
+
+# Number of converted dates memoized
+DATE_CACHE_SIZE = 4096
+
+# Budget of points of each trace of the line figures, and downsampling keeping the peaks : "lttb", "minmax" or None
+PLOT_POINTS = 2000
+PLOT_DOWNSAMPLING = "lttb"
+
+# Decimals of the values sent to the figures
+PLOT_DECIMALS = 1
+
+# Maximal size in memory of the figures cached by the dashboard, in bytes
+FIGURE_CACHE_SIZE = 64 * 2**20
+
+# Maximal size in memory of the forecasts cached by the pipeline, in bytes
+FORECAST_CACHE_SIZE = 256 * 2**20
+
+# Folder of the forecasts cached on disk (None to keep them in memory only)
+FORECAST_CACHE_FOLDER = None
+
+# Maximal number of forecasts cached on disk for each model
+FORECAST_CACHE_FILES = 32
+
+# Days of the dataset predicted at once when forecasting the whole dataset
+FORECAST_BATCH_DAYS = 180
+
+# Number of models trained at once by the dashboard, in worker processes
+TRAIN_WORKERS = 3
+
+# Number of background jobs whose status is kept
+JOBS_HISTORY = 20
+
 # Logging
 LOGS_FOLDER = "./logs/"
 LOG_LEVEL = "INFO"
@@ -12,17 +106,54 @@ LOG_LEVEL = "INFO"
 MODELS_FOLDER = "./models/"
 DATASET_RAW_FOLDER = "./datasets/raw"
 DATASET_PROCESSED_FOLDER = "./datasets/processed"
+DATASET_CACHE_FOLDER = "./datasets/cache"
+
+# Version of the expanded dataset, changed each time it is built or updated
+NAME_VERSION_EXPANDED = "expanded.version"
 
 # Database
 NAME_DB_EXPANDED = "db_expanded.db"
+NAME_PARQUET_EXPANDED = "expanded"
+
+# Pool of connections of each database
+SQL_POOL_SIZE = 5
+SQL_POOL_MAX_OVERFLOW = 10
+SQL_POOL_TIMEOUT = 30
+
+# Storage of the expanded dataset : "sqlite" or "parquet"
+STORAGE_BACKEND = "sqlite"
+
+# Dtype of the dataset in memory, stored as a single contiguous block ("float64" to disable the compact mode)
+DATASET_DTYPE = "float32"
+
+# Rollups of the expanded dataset, from the finest to the coarsest (the hourly dataset is the finest resolution)
+ROLLUP_FREQS = ["6H", "D", "W-MON", "MS"]
+
+# Minimal number of points of a served range : the coarsest resolution giving at least as many is used
+ROLLUP_POINTS = 500
+
+# Days cleaned again before the last stored date when updating the dataset, for the interpolation
+UPDATE_OVERLAP_DAYS = 3
 
 # Csv files
 NAME_CSV_POWER = "eco2mix-national-cons-def.csv"
 NAME_CSV_TEMP = "temperature-quotidienne-regionale.csv"
 NAME_CSV_WEATHER = "rayonnement-solaire-vitesse-vent-tri-horaires-regionaux.csv"
 
+# Number of concurrent downloads
+DOWNLOAD_WORKERS = 3
+
+# Number of records per page and of pages requested at once from the api
+API_PAGE_SIZE = 10000
+API_WORKERS = 4
+
 # Links and urls
 LINK_CSV_POWER = "https://odre.opendatasoft.com/explore/dataset/eco2mix-national-cons-def/download/?format=csv&timezone=Europe/Berlin&lang=fr&use_labels_for_header=true&csv_separator=%3B"
 LINK_CSV_TEMP = "https://odre.opendatasoft.com/explore/dataset/temperature-quotidienne-regionale/download/?format=csv&timezone=Europe/Berlin&lang=fr&use_labels_for_header=true&csv_separator=%3B"
 LINK_CSV_WEATHER = "https://odre.opendatasoft.com/explore/dataset/rayonnement-solaire-vitesse-vent-tri-horaires-regionaux/download/?format=csv&timezone=Europe/Berlin&lang=fr&use_labels_for_header=true&csv_separator=%3B"
 
+
+# Api of the datasets
+URL_API_POWER = "https://odre.opendatasoft.com/api/v2/catalog/datasets/eco2mix-national-cons-def"
+URL_API_TEMP = "https://odre.opendatasoft.com/api/v2/catalog/datasets/temperature-quotidienne-regionale"
+URL_API_WEATHER = "https://odre.opendatasoft.com/api/v2/catalog/datasets/rayonnement-solaire-vitesse-vent-tri-horaires-regionaux"
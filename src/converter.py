@@ -1,10 +1,84 @@
 # Libraries
 from datetime import datetime
+from functools import lru_cache
+import pandas as pd
+
+# Constants
+from config import DATE_FORMATS
+from config import DATE_CACHE_SIZE
+
+# Format of each shape of date seen so far : shape -> format
+formats = {}
+
+# Shape of a date : its digits are replaced, its separators are kept
+shape_table = str.maketrans("0123456789", "dddddddddd")
+
+def get_shape(input_date):
+    """Get the shape of a string date, shared by all the dates written with the same format
+
+    Args:
+        input_date (str): date as a string
+
+    Returns:
+        str: shape of the date ("2020-01-01 12:00" -> "dddd-dd-dd dd:dd")
+    """
+    return input_date.translate(shape_table)
+
+def find_format(input_date):
+    """Find the first format of DATE_FORMATS matching a string date
+
+    Args:
+        input_date (str): date as a string
+
+    Returns:
+        (str, datetime): format and date as a datetime, (None, None) if no format matches
+    """
+
+    for date_format in DATE_FORMATS:
+        try:
+            return date_format, datetime.strptime(input_date, date_format)
+        except ValueError:
+            pass
+
+    return None, None
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def parse(input_date):
+    """Convert a string date to a datetime, with the format detected once for its shape
+
+    Args:
+        input_date (str): date as a string
+
+    Returns:
+        datetime: date as a datetime, or the input if no format matches
+    """
+
+    shape = get_shape(input_date)
+    date_format = formats.get(shape)
+
+    # The format of the shape is tried first
+    if date_format:
+        try:
+            return datetime.strptime(input_date, date_format)
+        except ValueError:
+            pass
+
+    # Otherwise, all the formats are tried in order
+    date_format, output_date = find_format(input_date)
+
+    if date_format is None:
+        return input_date
+
+    formats.setdefault(shape, date_format)
+
+    return output_date
 
 def date(input_date):
     """Try to convert a string date to a datetime
 
-    *Ugly ! Please find a other solution*
+    The formats of DATE_FORMATS are tried in order. The format found is kept for all the dates of
+    the same shape, and the last DATE_CACHE_SIZE dates converted are memoized.
+
     Args:
         input_date (str): date as a string
 
@@ -13,27 +87,51 @@ def date(input_date):
 
     """
     if isinstance(input_date,  str):
-        try :
-            return datetime.strptime(input_date, "%Y-%m-%d %H:%M")
-        except:
-            try :
-                return datetime.strptime(input_date, "%Y-%m-%d %H:%M:%S")
-            except:
-                try :
-                    return datetime.strptime(input_date, "%Y-%m-%dT%H:%M:%S")
-                except:
-                    try :
-                        return datetime.strptime(input_date, "%Y-%m-%d")
-                    except:
-                        try :
-                            return datetime.strptime(input_date, "%Y-%m-%dT%H:%M")
-                        except:
-                            try :
-                                return datetime.strptime(input_date, "%Y-%m-%d %H:%M:%S.%f")
-                            except:
-                                try :
-                                    return datetime.strptime(input_date, "%Y-%m-%dT%H:%M:%S.%f")
-                                except:
-                                    return input_date
-                                    
-    return input_date
\ No newline at end of file
+        return parse(input_date)
+
+    return input_date
+
+def dates(input_dates):
+    """Convert many string dates to datetimes in one call
+
+    The dates are grouped by shape, and each group is parsed at once with its format.
+
+    Args:
+        input_dates (array-like): dates as strings
+
+    Returns:
+        pd.DatetimeIndex: dates, NaT where no format matches
+    """
+
+    input_dates = pd.Series(input_dates, dtype="object")
+    output_dates = pd.Series(pd.NaT, index=input_dates.index, dtype="datetime64[ns]")
+
+    # Shape of each date, None for the dates which are not strings
+    shapes = pd.Series([
+        input_date.translate(shape_table) if isinstance(input_date, str) else None
+        for input_date in input_dates.values
+    ], index=input_dates.index, dtype="object")
+
+    for shape, group in input_dates.groupby(shapes):
+
+        # The format of the shape is found on its first date
+        if shape not in formats:
+            date(group.iloc[0])
+
+        date_format = formats.get(shape)
+
+        if date_format:
+            output_dates[group.index] = pd.to_datetime(group, format=date_format, errors="coerce")
+
+        # The dates which don't fit the format of their shape are converted one by one
+        missing = output_dates[group.index].isna()
+
+        for position, input_date in group[missing].items():
+            output_date = date(input_date)
+            output_dates[position] = output_date if isinstance(output_date, datetime) else pd.NaT
+
+    # The other dates (datetimes, timestamps) are kept as they are
+    others = shapes.isna()
+    output_dates[others] = pd.to_datetime(input_dates[others], errors="coerce")
+
+    return pd.DatetimeIndex(output_dates)
@@ -0,0 +1,134 @@
+# Libraries
+import uuid
+import queue
+import logging
+import threading
+from datetime import datetime
+from collections import OrderedDict
+
+# Constants
+from config import JOBS_HISTORY
+
+logger = logging.getLogger("journal")
+
+class JobQueue():
+    """Queue of background jobs, run one after another by a worker thread
+
+    The status of each job (queued, running, done or failed), its progress, its message and its
+    result are kept for the last jobs, to be polled. A job is a function receiving a progress
+    callable, called with the fraction done and a message.
+
+    Args:
+        name (str, optional): name of the worker thread. Defaults to "jobs".
+        history (int, optional): number of jobs whose status is kept. Defaults to JOBS_HISTORY.
+    """
+    def __init__(self, name="jobs", history=JOBS_HISTORY):
+
+        self.name = name
+        self.history = history
+
+        self.queue = queue.Queue()
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def submit(self, name, function, *args, **kwargs):
+        """Add a job to the queue
+
+        A job already queued or running under the same name is not added twice.
+
+        Args:
+            name (str): name of the job
+            function (callable): function of the job, receiving a progress keyword argument
+            args (list): arguments of the function
+            kwargs (dict): keyword arguments of the function
+
+        Returns:
+            str: id of the job
+        """
+
+        with self.lock:
+
+            for job in self.jobs.values():
+                if job["name"] == name and job["status"] in ("queued", "running"):
+                    return job["id"]
+
+            job_id = uuid.uuid4().hex
+
+            self.jobs[job_id] = {
+                "id" : job_id,
+                "name" : name,
+                "status" : "queued",
+                "progress" : 0.0,
+                "message" : "queued",
+                "submitted" : datetime.now(),
+                "started" : None,
+                "finished" : None,
+                "result" : None,
+            }
+
+            # Only the status of the last jobs is kept
+            while len(self.jobs) > self.history:
+                self.jobs.popitem(last=False)
+
+            # The worker is started with the first job, in the process serving the requests
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+                self.thread.start()
+
+        self.queue.put((job_id, function, args, kwargs))
+
+        logger.info(f"job {name} {job_id} queued")
+
+        return job_id
+
+    def update(self, job_id, **status):
+        """Update the status of a job"""
+
+        with self.lock:
+            if job_id in self.jobs:
+                self.jobs[job_id].update(status)
+
+    def get(self, job_id):
+        """Get the status of a job
+
+        Args:
+            job_id (str): id of the job
+
+        Returns:
+            dict: status of the job, None if unknown
+        """
+
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def run(self):
+        """Run the jobs of the queue, one after another"""
+
+        while True:
+
+            job_id, function, args, kwargs = self.queue.get()
+
+            self.update(job_id, status="running", started=datetime.now(), message="running")
+
+            progress = lambda fraction, message="" : self.update(job_id, progress=fraction, message=message)
+
+            try:
+                result = function(*args, progress=progress, **kwargs)
+
+                # The last message reported by the job is kept as its summary
+                job = self.get(job_id)
+                message = job["message"] if job["progress"] else "done"
+
+                self.update(job_id, status="done", progress=1.0, finished=datetime.now(), message=message, result=result)
+
+                logger.info(f"job {job_id} done")
+
+            except Exception as exce:
+                self.update(job_id, status="failed", finished=datetime.now(), message=str(exce))
+
+                logger.error(f"job {job_id} failed : {exce}")
+
+            finally:
+                self.queue.task_done()
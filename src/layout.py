@@ -29,6 +29,25 @@ footer =  html.P(
     }
 )
 
+train_status = html.P(
+    "",
+    id="train-status",
+    style={
+        "font-size" : "11px"
+    }
+)
+
+# Polling of the training job, enabled while it runs
+train_interval = dcc.Interval(
+    id="train-interval",
+    interval=2000,
+    disabled=True,
+)
+
+train_job = dcc.Store(
+    id="train-job",
+)
+
 learn_more_button = html.Button(
     'Learn more', 
     id='learn-more-button', 
@@ -368,6 +387,9 @@ layout_composition = dbc.Container(
             )
         ),
         dbc.Row(footer),
+        dbc.Row(train_status),
+        train_interval,
+        train_job,
         modal_window,
     ],
     fluid=True,
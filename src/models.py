@@ -3,6 +3,8 @@ from fbprophet import Prophet
 from sklearn.model_selection import train_test_split
 from fbprophet.plot import plot_components_plotly
 import logging
+import pickle
+import hashlib
 
 # Modules
 import store
@@ -24,6 +26,19 @@ class ModelProphet():
         self.folder = MODELS_FOLDER
         self.trained = False
         self.fbmodel = None
+        self.fingerprint = None
+
+    def get_fingerprint(self):
+        """Fingerprint of the fitted model : sha1 of its pickle
+
+        Returns:
+            str: fingerprint, None if the model isn't fitted
+        """
+
+        if self.fbmodel is None:
+            return None
+
+        return hashlib.sha1(pickle.dumps(self.fbmodel)).hexdigest()
 
     def prepare_df_for_prophet(self, df):
         """Reorganize the columns of the df for fbprophet.
@@ -32,6 +47,8 @@ class ModelProphet():
         * column 'y' for the target
         * other columns for the regressors
 
+        The target and the regressors are converted to float64.
+
         Args:
             df (pd.DataFrame): dataframe
 
@@ -54,6 +71,9 @@ class ModelProphet():
         # Selected the required columns
         df = df.loc[:, columns]
 
+        # The dataset may be held as float32, Prophet works with float64
+        df = df.astype({column : "float64" for column in self.regressors + ["y"]})
+
         logger.debug(f"df is prepared for training or testing")
 
         return df
@@ -89,6 +109,7 @@ class ModelProphet():
         # Keep the model 
         self.fbmodel = fbmodel
         self.df_train = df_train
+        self.fingerprint = self.get_fingerprint()
 
         self.trained = True
 
@@ -118,6 +139,7 @@ class ModelProphet():
     def load(self, ):
 
         self.fbmodel = store.load_model(self.name, self.folder)
+        self.fingerprint = self.get_fingerprint()
         self.trained = True
 
         logger.info(f"{self.name} is loaded from its pkl file")
@@ -6,6 +6,9 @@ from datetime import date, datetime, timedelta
 import matplotlib.pyplot as plt
 import logging
 import os
+import tempfile
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # Modules
 import journal
@@ -14,24 +17,101 @@ import collector
 import cleaner
 import selector
 import store
+import cache
 
 # Constants
 from config import COL_POWER
 from config import COL_TEMP
 from config import COL_WEATHER
+from config import SCHEMA_CSV_POWER
+from config import SCHEMA_CSV_TEMP
+from config import SCHEMA_CSV_WEATHER
+from config import CSV_CHUNKSIZE
 from config import DATASET_RAW_FOLDER
 from config import DATASET_PROCESSED_FOLDER
+from config import DATASET_CACHE_FOLDER
 from config import MODELS_FOLDER
 from config import NAME_CSV_POWER
 from config import NAME_CSV_TEMP
 from config import NAME_CSV_WEATHER
 from config import NAME_DB_EXPANDED
+from config import NAME_PARQUET_EXPANDED
+from config import STORAGE_BACKEND
 from config import LINK_CSV_POWER
 from config import LINK_CSV_TEMP
 from config import LINK_CSV_WEATHER 
+from config import DOWNLOAD_WORKERS
+from config import SCHEMA_API_POWER
+from config import SCHEMA_API_TEMP
+from config import SCHEMA_API_WEATHER
+from config import ORDER_API_POWER
+from config import ORDER_API_TEMP
+from config import ORDER_API_WEATHER
+from config import URL_API_POWER
+from config import URL_API_TEMP
+from config import URL_API_WEATHER
+from config import API_PAGE_SIZE
+from config import API_WORKERS
+from config import UPDATE_OVERLAP_DAYS
+from config import DATASET_DTYPE
+from config import ROLLUP_FREQS
+from config import NAME_VERSION_EXPANDED
+from config import FORECAST_CACHE_SIZE
+from config import FORECAST_CACHE_FOLDER
+from config import FORECAST_CACHE_FILES
+from config import FORECAST_BATCH_DAYS
 
 logger = journal.init_journal()
 
+def acquire_dataset(type_, data_from, since, path):
+    """Read and clean a dataset in a worker process
+
+    Args:
+        type_ (str): "power", "temp" or "weather"
+        data_from (str): "csv" or "api"
+        since (datetime): only get the records from this date
+        path (Path): Arrow IPC file receiving the cleaned dataset
+
+    Returns:
+        Path: path of the Arrow IPC file
+    """
+
+    pip = Pipeline()
+
+    df = pip.data_transform(pip.data_read(type_, data_from=data_from, since=since), type_=type_, data_from=data_from, since=since)
+    store.save_ipc(df, path)
+
+    return path
+
+def train_worker(name, parameters, path):
+    """Train a model in a worker process
+
+    The model is saved to its pkl file by the training, to be loaded by the main process.
+
+    Args:
+        name (str): name of the model
+        parameters (dict): parameters of the model (target, regressors, end_training)
+        path (Path): Arrow IPC file holding the training data of all the models
+
+    Returns:
+        str: name of the model
+    """
+
+    model = models.ModelProphet(
+        name=name,
+        target_column=parameters.get("target"),
+        regressor_columns=parameters.get("regressors"),
+        end_training=parameters.get("end_training"))
+
+    # The training data is memory-mapped, then restricted to the model
+    df_train = store.load_ipc(path)
+    df_train = selector.get_dates(df_train, end=model.end_training)
+    df_train = selector.get_columns(df_train, columns=model.columns_base)
+
+    model.train(df_train)
+
+    return name
+
 class Pipeline():
     """The Pipeline is there to :
 
@@ -39,10 +119,28 @@ class Pipeline():
     * process the data : clean and joining
     * serve the data : shrink and select
 
+    In lazy mode, only the dates of the dataset are held in memory. The slices
+    requested by data_serve are loaded from the storage backend on demand.
 
+    Args:
+        lazy (bool, optional): serve the data from the storage backend. Defaults to False.
     """
-    def __init__(self,):
-        
+    def __init__(self, lazy=False):
+
+        self.lazy = lazy
+        self.df = None
+        self.index = None
+        self.lookup = None
+        self.lookup_index = None
+
+        # Version of the stored dataset, changed each time it is built or updated, and the version
+        # of its last full build : the dataset was only appended to since the base version
+        self.version = None
+        self.version_base = None
+
+        # Forecasts of the models, by model, fit, version of the dataset and window
+        self.forecasts = cache.LRUCache(max_size=FORECAST_CACHE_SIZE, name="forecasts")
+
         self.models = {
             "prophet_time" :{
                 "name" : "Prophet based on time series",
@@ -77,22 +175,57 @@ class Pipeline():
         self.path_csv_weather = Path(DATASET_RAW_FOLDER, NAME_CSV_WEATHER)
 
         self.path_db_expanded = Path(DATASET_PROCESSED_FOLDER, NAME_DB_EXPANDED)
+        self.path_parquet_expanded = Path(DATASET_PROCESSED_FOLDER, NAME_PARQUET_EXPANDED)
+        self.path_version = Path(DATASET_PROCESSED_FOLDER, NAME_VERSION_EXPANDED)
+
+        # Storage of the expanded dataset
+        path_expanded = self.path_parquet_expanded if STORAGE_BACKEND == "parquet" else self.path_db_expanded
+        self.backend = store.get_backend(STORAGE_BACKEND, path_expanded, table="expanded")
+
+        # Storage of the rollups : tables of the same database, or folders next to the dataset
+        self.backends_rollup = {
+            freq : store.get_backend(
+                STORAGE_BACKEND,
+                Path(f"{self.path_parquet_expanded}_{freq}") if STORAGE_BACKEND == "parquet" else self.path_db_expanded,
+                table=f"expanded_{freq}"
+            )
+            for freq in ROLLUP_FREQS
+        }
+        self.dfs_rollup = {}
+
+        # Storage of the forecasts of the whole dataset by each model, with the fit and the version of the dataset predicted
+        self.backends_history = {
+            name : store.get_backend(
+                STORAGE_BACKEND,
+                Path(f"{self.path_parquet_expanded}_forecast_{name}") if STORAGE_BACKEND == "parquet" else self.path_db_expanded,
+                table=f"forecast_{name}"
+            )
+            for name in self.models
+        }
+        self.paths_history_version = {name : Path(DATASET_PROCESSED_FOLDER, f"forecast_{name}.version") for name in self.models}
 
     def create_folders(self,):
         """Create static folders
         """
 
-        for path in [DATASET_RAW_FOLDER, DATASET_PROCESSED_FOLDER]:
+        for path in [DATASET_RAW_FOLDER, DATASET_PROCESSED_FOLDER, DATASET_CACHE_FOLDER, FORECAST_CACHE_FOLDER]:
+
+            if not path:
+                continue
+
+
             Path(path).mkdir(parents=True, exist_ok=True)
             logger.debug(f" folder {path} created")
 
 
-    def data_process(self, update=False, download=False, data_from="csv"):
+    def data_process(self, update=False, download=False, data_from="csv", workers=1, incremental=False):
         """Get the data
 
         Args:
             update (bool, optional): recreate the dataset. Defaults to False.
             data_from (str, optional): where does the data come from. Defaults to "csv".
+            workers (int, optional): number of processes reading and cleaning the datasets. Defaults to 1.
+            incremental (bool, optional): with update, only append the new rows to the stored dataset. Defaults to False.
         """
 
         logger.info("processing...")        
@@ -104,32 +237,171 @@ class Pipeline():
                     urls=[LINK_CSV_POWER, LINK_CSV_TEMP, LINK_CSV_WEATHER]
                 )
 
-            self.data_acquire(data_from=data_from)
-            self.data_join()
-            self.data_save()
+            # Fall back to a full rebuild if there is no stored dataset
+            if not (incremental and self.data_update(data_from=data_from, workers=workers)):
+                self.data_acquire(data_from=data_from, workers=workers)
+                self.data_join()
+                self.data_save()
         else:
             #Load data from db
             try:
                 self.data_load()
                 
-                if self.df.empty:
+                if self.data_serve(only_index=True).empty:
                     raise Exception("the loaded database is empty")
 
             except Exception as exce:
                 logger.error("unable to load the database. A new one will be created")
-                self.data_process(update=True)
+                self.data_process(update=True, workers=workers)
 
         logger.info(f"the data has been processed successfully")
 
     def data_save(self, ):
-        """Save the dataset to a database
+        """Save the dataset to the storage backend
+
+        In lazy mode, the dataset is then released and only its dates are kept.
         """
-        store.save_sql(self.df, self.path_db_expanded, sql_table="expanded", if_exists="replace")
+        self.backend.save(self.df)
+        self.data_rollup()
+        self.data_version(renew=True)
+
+        if self.lazy:
+            self.data_load()
+
+    def data_update(self, data_from="csv", workers=1):
+        """Append the new rows to the stored dataset
+
+        Only the rows after the high-water mark (the last longdate stored) are cleaned and joined,
+        plus an overlap window for the interpolation. They are then upserted to the storage backend,
+        and the stored forecasts of the models are extended to them.
+
+        Args:
+            data_from (str, optional): "csv" or "api". Defaults to "csv".
+            workers (int, optional): number of processes reading and cleaning the datasets. Defaults to 1.
+
+        Returns:
+            bool: False if there is no stored dataset to update
+        """
+
+        watermark = self.backend.load_watermark()
+
+        if watermark is None:
+            logger.warning("no stored dataset to update")
+            return False
+
+        logger.info(f"updating the dataset after {watermark}...")
+
+        # The dataset in memory, if any, is kept to append the new rows
+        df_stored = self.df
+
+        self.data_acquire(data_from=data_from, since=watermark - timedelta(days=UPDATE_OVERLAP_DAYS), workers=workers)
+
+        # Nothing can be joined while a dataset has no record since the watermark
+        if any(df.empty for df in [self.df_power, self.df_temp, self.df_weather]):
+            logger.info("no new records, the dataset is up to date")
+            return True
+
+        self.data_join()
+
+        df_new = self.df.iloc[self.df.index > watermark]
+
+        if not df_new.empty:
+            self.data_version()
+
+            self.backend.upsert(df_new)
+            self.data_rollup(since=df_new.index.min())
+            self.data_version(renew=True, base=self.version_base)
+
+        if df_stored is not None and not self.lazy:
+            self.df = store.compact(pd.concat([df_stored.iloc[df_stored.index <= watermark], df_new]), dtype=DATASET_DTYPE)
+        else:
+            self.data_load()
+
+        logger.info(f"{len(df_new)} rows appended to the dataset")
+
+        # Only the new dates are predicted, the stored dates didn't change
+        if not df_new.empty:
+            self.forecast_histories(stored=True)
+
+        return True
 
     def data_load(self):
-        """Load the dataset from a databace
+        """Load the dataset from the storage backend
+
+        The columns are held in a single contiguous block of DATASET_DTYPE.
+        In lazy mode, only the dates are loaded. Otherwise, the rollups are loaded too.
+        """
+
+        if self.lazy:
+            self.df = None
+            self.index = self.backend.load_index()
+
+        else:
+            self.df = self.backend.load(dtype=DATASET_DTYPE)
+
+        # The rollups are built if the stored dataset has none yet
+        if any(backend.load_watermark() is None for backend in self.backends_rollup.values()) and not self.data_serve(only_index=True).empty:
+            self.data_rollup()
+
+        elif not self.lazy:
+            self.dfs_rollup = {freq : backend.load(dtype=DATASET_DTYPE) for freq, backend in self.backends_rollup.items()}
+
+        self.data_version()
+
+    def data_version(self, renew=False, base=None):
+        """Get the version of the stored dataset, shared by all the processes using it
+
+        The version is a random token written next to the dataset, followed by its base version :
+        the version of the last full build, since which rows were only appended. A new version is
+        written with renew, or if the dataset has none yet.
+
+        Args:
+            renew (bool, optional): write a new version. Defaults to False.
+            base (str, optional): base version of the new version, itself if None. Defaults to None.
+
+        Returns:
+            str: version
         """
-        self.df = store.load_sql(self.path_db_expanded, sql_table="expanded")
+
+        if renew or not self.path_version.exists():
+            version = uuid.uuid4().hex
+            self.path_version.write_text(f"{version} {base or version}")
+
+        # The versions written before the bases are their own base
+        tokens = self.path_version.read_text().split()
+
+        self.version = tokens[0]
+        self.version_base = tokens[-1]
+
+        return self.version
+
+    def data_rollup(self, since=None):
+        """Build the rollups of the dataset and save them to their storage backends
+
+        Each rollup holds the mean, the minimum and the maximum of the columns over bins of
+        one of the ROLLUP_FREQS. With since, only the bins from the one containing this date are
+        built again, from the stored dataset.
+
+        Args:
+            since (datetime, optional): first date changed in the dataset. Defaults to None.
+        """
+
+        for freq, backend in self.backends_rollup.items():
+
+            if since is None:
+                df = self.df if self.df is not None else self.backend.load(dtype=DATASET_DTYPE)
+                df_rollup = store.compact(cleaner.rollup(df, freq), dtype=DATASET_DTYPE)
+                backend.save(df_rollup)
+
+            else:
+                start = cleaner.get_bin_start(since, freq)
+                df_rollup = store.compact(cleaner.rollup(self.backend.load(dtype=DATASET_DTYPE, start=start), freq), dtype=DATASET_DTYPE)
+                backend.upsert(df_rollup)
+
+            if not self.lazy:
+                self.dfs_rollup[freq] = backend.load(dtype=DATASET_DTYPE) if since is not None else df_rollup
+
+            logger.debug(f"rollup {freq} built : {len(df_rollup)} rows")
 
     def get_download_datetime(self):
 
@@ -141,88 +413,148 @@ class Pipeline():
         return datetime.fromtimestamp(timestamp)
 
     def data_download(self, paths=[], urls=[]):
+        """Download the datasets concurrently
+
+        Files that didn't change since their last download are not transferred again.
 
-        for path, url in zip(paths, urls):
-            collector.from_web(url, path, DATASET_RAW_FOLDER)
+        Args:
+            paths (list, optional): paths of the files. Defaults to [].
+            urls (list, optional): urls of the files. Defaults to [].
+        """
 
-    def data_acquire(self, data_from="csv"):
-        """Get the data from csv files
+        collector.from_web_all(urls, paths, max_workers=DOWNLOAD_WORKERS)
 
-        If the csv file is not present, it will be downloaded before reading.
+    def data_read(self, type_="temp", data_from="csv", since=None):
+        """Read a raw dataset from its csv file or from the api
+
+        The csv files are converted once to a parquet cache, then streamed by chunks from it.
+        The api datasets are exported by pages.
 
         Args:
+            type_ (str, optional): "power", "temp" or "weather". Defaults to "temp".
             data_from (str, optional): "csv" or "api". Defaults to "csv".
+            since (datetime, optional): with the api, only get the records from this date. Defaults to None.
+
+        Returns:
+            iterator: chunks of the raw dataset
         """
 
         if data_from == "csv":
 
-            # Read (and get) the temp csv file
-            if not self.path_csv_temp.exists():
-                self.data_download(paths=[self.path_csv_temp,], urls=[LINK_CSV_TEMP])
-            df_temp_raw = collector.from_csv(self.path_csv_temp)
+            path, schema = {
+                "power" : (self.path_csv_power, SCHEMA_CSV_POWER),
+                "temp" : (self.path_csv_temp, SCHEMA_CSV_TEMP),
+                "weather" : (self.path_csv_weather, SCHEMA_CSV_WEATHER),
+            }.get(type_)
 
-            # Read (and get) the weather csv file
-            if not self.path_csv_weather.exists():
-                self.data_download(paths=[self.path_csv_weather,], urls=[LINK_CSV_WEATHER])
-            df_weather_raw = collector.from_csv(self.path_csv_weather)    
-
-            # Read (and get) the power csv file
-            if not self.path_csv_power.exists():
-                self.data_download(paths=[self.path_csv_power,], urls=[LINK_CSV_POWER])
-            df_power_raw = collector.from_csv(self.path_csv_power)
+            return collector.from_cache(path, DATASET_CACHE_FOLDER, schema=schema, chunksize=CSV_CHUNKSIZE)
 
         elif data_from == "api":
 
-            pass
-            # select_power = "%2C".join(COL_POWER+["date", "heure", "consommation"])
-            # where_power = "nucleaire%3E0"
-            # limit_power=-1
-            
-            # url_power_json = f"https://odre.opendatasoft.com/api/v2/catalog/datasets/eco2mix-national-cons-def/exports/json?select={select_power}&where={where_power}&limit={limit_power}&offset=0&timezone=UTC"
-            
-            # df_power_raw = collector.from_api(url_power_json)
-            
-            # select_temp = "%2C".join(COL_TEMP + ["date",])
-            # limit_temp=-1
-            # df_temp_raw = collector.from_api(f"https://odre.opendatasoft.com/api/v2/catalog/datasets/temperature-quotidienne-regionale/exports/json?select={select_temp}&limit={limit_temp}&offset=0&timezone=UTC")
-        
-            # limit_weather=-1       
-            # select_weather = "%2C".join(["date", "uv100", "ssrd03h"])
-            # df_weather_raw = collector.from_api(f"https://odre.opendatasoft.com/api/v2/catalog/datasets/rayonnement-solaire-vitesse-vent-tri-horaires-regionaux/exports/json?select={select_weather}&limit={limit_weather}&offset=0&timezone=UTC")
+            url, schema, order_by = {
+                "power" : (URL_API_POWER, SCHEMA_API_POWER, ORDER_API_POWER),
+                "temp" : (URL_API_TEMP, SCHEMA_API_TEMP, ORDER_API_TEMP),
+                "weather" : (URL_API_WEATHER, SCHEMA_API_WEATHER, ORDER_API_WEATHER),
+            }.get(type_)
+
+            # Only the records from the since date are requested
+            where = collector.where_since("date", since) if since else None
+
+            return collector.from_api(url, schema, where=where, order_by=order_by, page_size=API_PAGE_SIZE, max_workers=API_WORKERS)
+
+    def data_acquire(self, data_from="csv", since=None, workers=1):
+        """Get the data from csv files or from the api
+
+        If a csv file is not present, it will be downloaded before reading.
+        The chunks of each dataset are cleaned and aggregated one at a time.
+        With more than one worker, each dataset is read and cleaned in its own process.
+
+        Args:
+            data_from (str, optional): "csv" or "api". Defaults to "csv".
+            since (datetime, optional): only get the records from this date. Defaults to None.
+            workers (int, optional): number of worker processes. Defaults to 1.
+        """
+
+        if data_from == "csv":
+
+            # Get the missing csv files, all at once
+            missing = [
+                (path, url) for path, url in zip(
+                    [self.path_csv_power, self.path_csv_temp, self.path_csv_weather],
+                    [LINK_CSV_POWER, LINK_CSV_TEMP, LINK_CSV_WEATHER])
+                if not path.exists()
+            ]
+
+            if missing:
+                self.data_download(paths=[path for path, _ in missing], urls=[url for _, url in missing])
+
+        types = ["power", "temp", "weather"]
 
-        # Clean the raw datasets
-        self.df_power = self.data_transform(df_power_raw, type_="power", data_from=data_from)
-        self.df_temp = self.data_transform(df_temp_raw, type_="temp", data_from=data_from)  
-        self.df_weather = self.data_transform(df_weather_raw, type_="weather", data_from=data_from)
+        if workers > 1:
+            dfs = self.data_acquire_parallel(types, data_from=data_from, since=since, workers=workers)
 
-    def data_transform(self, df, type_="temp", data_from="api"):
+        else:
+            dfs = {
+                type_ : self.data_transform(self.data_read(type_, data_from=data_from, since=since), type_=type_, data_from=data_from, since=since)
+                for type_ in types
+            }
+
+        # Keep the cleaned datasets
+        self.df_power = dfs.get("power")
+        self.df_temp = dfs.get("temp")
+        self.df_weather = dfs.get("weather")
+
+    def data_acquire_parallel(self, types, data_from="csv", since=None, workers=3):
+        """Read and clean the datasets in worker processes
+
+        The workers don't send back pickled dataframes : each cleaned dataset is written
+        to an Arrow IPC file, which is memory-mapped by the main process.
+
+        Args:
+            types (list): types of the datasets
+            data_from (str, optional): "csv" or "api". Defaults to "csv".
+            since (datetime, optional): only get the records from this date. Defaults to None.
+            workers (int, optional): number of worker processes. Defaults to 3.
+
+        Returns:
+            dict: type -> cleaned dataset
+        """
+
+        logger.info(f"acquiring {len(types)} datasets with {workers} workers...")
+
+        with tempfile.TemporaryDirectory(dir=DATASET_CACHE_FOLDER) as folder:
+
+            with ProcessPoolExecutor(max_workers=min(workers, len(types))) as executor:
+
+                futures = {
+                    type_ : executor.submit(acquire_dataset, type_, data_from, since, Path(folder, f"{type_}.arrow"))
+                    for type_ in types
+                }
+
+                return {type_ : store.load_ipc(future.result()) for type_, future in futures.items()}
+
+    def data_transform(self, df, type_="temp", data_from="api", since=None):
 
         if type_ == "temp":
-            return cleaner.clean_temp(df, columns=COL_TEMP, data_from=data_from)
+            return cleaner.clean_temp(df, columns=COL_TEMP, data_from=data_from, since=since)
 
         elif type_ == "weather":           
-            return cleaner.clean_weather(df, columns=COL_WEATHER, data_from=data_from)            
+            return cleaner.clean_weather(df, columns=COL_WEATHER, data_from=data_from, since=since)            
 
         elif type_ == "power":
-            return cleaner.clean_power(df, columns=COL_POWER, data_from=data_from)
+            return cleaner.clean_power(df, columns=COL_POWER, data_from=data_from, since=since)
 
     def data_join(self, ):
+        """Join the cleaned datasets on a common hourly grid, in a single block of DATASET_DTYPE
 
-        weather_index_hourly = pd.date_range(start=self.df_weather.index.min(), end=self.df_weather.index.max(), freq="1H")
-        self.df_weather = self.df_weather.reindex(weather_index_hourly).interpolate(method="linear")
-
-        power_index_hourly = pd.date_range(start=self.df_power.index.min(), end=self.df_power.index.max(), freq="1H")
-        self.df_power = self.df_power.reindex(power_index_hourly).interpolate(method="linear")
-
-        temp_index_hourly = pd.date_range(start=self.df_temp.index.min(), end=self.df_temp.index.max(), freq="1H")
-        self.df_temp = self.df_temp.reindex(temp_index_hourly).interpolate(method="linear")
-
-        df_power_weather = self.df_power.join(self.df_weather)
-        self.df = df_power_weather.join(self.df_temp)
+        The cleaned datasets are released once joined.
+        """
 
-        cleaner.clean_nan_rows(self.df)
+        self.df = cleaner.align_hourly([self.df_power, self.df_weather, self.df_temp], dtype=DATASET_DTYPE)
 
-        self.df.index.name = "longdate"
+        self.df_power = None
+        self.df_temp = None
+        self.df_weather = None
 
     def train_model(self, model):
         """Launch the training of a model
@@ -274,10 +606,19 @@ class Pipeline():
 
             logger.info(f"model {name} is initialized")
 
-    def train_models(self):
+    def train_models(self, workers=1):
         """Launch the training of all models
+
+        Args:
+            workers (int, optional): number of models trained at once in worker processes. Defaults to 1.
+
+        Returns:
+            dict: with workers, name of the model -> None if it has been trained, else the error
         """
 
+        if workers > 1:
+            return self.train_models_parallel(workers=workers)
+
         for parameters in self.models.values():
             # Get the model
             model = parameters.get("model")
@@ -289,16 +630,154 @@ class Pipeline():
             parameters["trained"] = trained
 
             logger.info(f"model {model.name} is trained")
+
+            # Predict the whole dataset with the new fit
+            if trained:
+                self.forecast_history(model)
             
 
-    def data_serve(self, start=None, end=None, date=None, columns=[], only_index=False):
+    def train_models_parallel(self, workers=2, progress=None):
+        """Train the models in worker processes
+
+        The training data of all the models is written once to an Arrow IPC file, memory-mapped by
+        the workers. As soon as a worker is done, its model is loaded from its pkl file in a new
+        instance, which predicts the whole dataset and then replaces the previous instance at once :
+        the model in use is never seen half-updated. A failure is logged, reported in the progress
+        messages and only affects its model.
+
+        Args:
+            workers (int, optional): number of worker processes. Defaults to 2.
+            progress (callable, optional): called with the fraction of models done and a message. Defaults to None.
+
+        Raises:
+            RuntimeError: if no model could be trained
+
+        Returns:
+            dict: name of the model -> None if it has been trained, else the error
+        """
+
+        logger.info(f"training {len(self.models)} models with {workers} workers...")
+
+        # The dates and the columns needed by all the models
+        columns = list(dict.fromkeys(column for parameters in self.models.values() for column in [parameters.get("target"), ] + parameters.get("regressors")))
+        end = max(pd.Timestamp(parameters.get("end_training")) for parameters in self.models.values())
+
+        errors = {}
+
+        with tempfile.TemporaryDirectory(dir=DATASET_CACHE_FOLDER) as folder:
+
+            path = Path(folder, "train.arrow")
+            store.save_ipc(self.data_serve(end=end, columns=columns), path)
+
+            with ProcessPoolExecutor(max_workers=min(workers, len(self.models))) as executor:
+
+                futures = {
+                    executor.submit(train_worker, name, {key : value for key, value in parameters.items() if key != "model"}, path) : name
+                    for name, parameters in self.models.items()
+                }
+
+                for done, future in enumerate(as_completed(futures), start=1):
+
+                    name = futures[future]
+                    parameters = self.models[name]
+                    model = parameters.get("model")
+
+                    try:
+                        future.result()
+
+                        # The new fit is loaded in a new instance
+                        model = models.ModelProphet(
+                            name=name,
+                            target_column=model.target,
+                            regressor_columns=model.regressors,
+                            end_training=model.end_training)
+                        model.load()
+
+                        # Predict the whole dataset with the new fit, then swap the model in
+                        self.forecast_history(model)
+
+                        parameters["model"] = model
+                        parameters["trained"] = True
+
+                        errors[name] = None
+
+                        logger.info(f"model {name} is trained")
+
+                    except Exception as exce:
+                        errors[name] = exce
+
+                        logger.error(f"unable to train {name} : {exce}")
+
+                    failed = [key for key, error in errors.items() if error is not None]
+
+                    if progress:
+                        message = f"{done - len(failed)}/{len(futures)} models trained"
+                        message += f", failed : {', '.join(failed)}" if failed else ""
+                        progress(done / len(futures), message)
+
+        if all(error is not None for error in errors.values()):
+            raise RuntimeError(f"no model could be trained : {', '.join(f'{name} ({error})' for name, error in errors.items())}")
+
+        return errors
+
+    def get_lookup(self):
+        """Get the lookup of the dates of the dataset, built again when the dataset changes
+
+        Returns:
+            dict: lookup given by selector.get_lookup, None if the dates are not hourly
+        """
+
+        if self.lookup_index is not self.df.index:
+            self.lookup = selector.get_lookup(self.df.index, freq="H")
+            self.lookup_index = self.df.index
+
+        return self.lookup
+
+    def get_resolution(self, start=None, end=None, points=0):
+        """Get the coarsest rollup giving at least a number of points over a range of dates
+
+        Args:
+            start (datetime, optional): minimal date. Defaults to None.
+            end (datetime, optional): maximal date. Defaults to None.
+            points (int, optional): minimal number of points. Defaults to 0.
+
+        Returns:
+            str: frequency of the rollup, None if only the hourly dataset gives enough points
+        """
+
+        index = self.data_serve(only_index=True)
+
+        if index.empty:
+            return None
+
+        start = pd.Timestamp(start) if start else index.min()
+        end = pd.Timestamp(end) if end else index.max()
+
+        for freq in reversed(ROLLUP_FREQS):
+
+            # A rollup missing in memory is skipped
+            if not self.lazy and self.dfs_rollup.get(freq, pd.DataFrame()).empty:
+                continue
+
+            if len(pd.date_range(cleaner.get_bin_start(start, freq), end, freq=freq)) >= points:
+                return freq
+
+        return None
+
+    def data_serve(self, start=None, end=None, date=None, columns=[], only_index=False, points=None):
         """Send a part of the dataframe based on the selection variables
 
+        In lazy mode, the selection is loaded from the storage backend.
+        With points, a range is served from the coarsest rollup giving at least this number of
+        points (see get_resolution), as the means of the columns over its bins. The minimums and
+        maximums can be requested as <column>_min and <column>_max when a rollup is used.
+
         Args:
             start (_type_, optional): _description_. Defaults to None.
             end (_type_, optional): _description_. Defaults to None.
             date (_type_, optional): _description_. Defaults to None.
             columns (list, optional): _description_. Defaults to [].
+            points (int, optional): minimal number of points of the range. Defaults to None.
 
         Returns:
             pd.Dataframe: _description_
@@ -306,12 +785,43 @@ class Pipeline():
 
         if only_index:
             
-            return self.df.index
+            return self.index if self.lazy else self.df.index
+
+        freq = self.get_resolution(start=start, end=end, points=points) if points and not date else None
+
+        if freq:
+
+            if self.lazy:
+                df_columns = self.backends_rollup[freq].load(dtype=DATASET_DTYPE, start=start, end=end, columns=columns)
+            else:
+                df_columns = selector.get_columns(selector.get_dates(self.dfs_rollup[freq], start=start, end=end), columns=columns)
+
+            logger.debug(f"df restricted to dates bewteen {start} and {end}, from the rollup {freq}")
+
+            return df_columns
+
+        elif points and any(column.endswith(("_min", "_max")) for column in columns):
+
+            # At the hourly resolution, the minimum and the maximum of a column are its values
+            bases = [column[:-4] if column.endswith(("_min", "_max")) else column for column in columns]
+            df_columns = self.data_serve(start=start, end=end, date=date, columns=list(dict.fromkeys(bases)))
+
+            return df_columns.loc[:, bases].set_axis(columns, axis=1)
 
         else:
+
+            if self.lazy:
+
+                # A date is the range of one second starting at this date
+                if date and not (start or end):
+                    start, end = pd.Timestamp(date), pd.Timestamp(date) + timedelta(seconds=1)
+
+                df_columns = self.backend.load(dtype=DATASET_DTYPE, start=start, end=end, columns=columns)
+
+            else:
             
-            df_dates = selector.get_dates(self.df, start=start, end=end, date=date )
-            df_columns = selector.get_columns(df_dates, columns=columns)
+                df_dates = selector.get_dates(self.df, start=start, end=end, date=date, lookup=self.get_lookup())
+                df_columns = selector.get_columns(df_dates, columns=columns)
 
             text = f"dates bewteen {start} and {end}" if not date else f"date equal to {date}"
             logger.debug(f"df restricted to {text}")
@@ -319,19 +829,156 @@ class Pipeline():
 
             return df_columns
     
-    def data_test(self, start=None, end=None, extra_columns=[],  model_name=None):
-        """_summary_
+    def data_serve_dates(self, dates, columns=[]):
+        """Send the rows of many dates at once
+
+        In lazy mode, the range covering the dates is loaded from the storage backend.
 
         Args:
-            start (_type_, optional): _description_. Defaults to None.
-            end (_type_, optional): _description_. Defaults to None.
-            extra_columns (list, optional): _description_. Defaults to [].
-            model_name (_type_, optional): _description_. Defaults to None.
+            dates (array-like): dates
+            columns (list, optional): columns to select. Defaults to [].
 
         Returns:
-            _type_: _description_
+            pd.DataFrame: rows of the dates found in the dataset
         """
-       
+
+        dates = pd.to_datetime(dates)
+
+        if self.lazy:
+
+            if not len(dates):
+                return self.data_serve(start=self.index.max() + timedelta(seconds=1), columns=columns)
+
+            df = self.backend.load(dtype=DATASET_DTYPE, start=dates.min(), end=dates.max() + timedelta(seconds=1), columns=columns)
+            df_dates = selector.get_dates_at(df, dates)
+
+        else:
+
+            df_dates = selector.get_dates_at(selector.get_columns(self.df, columns=columns), dates, lookup=self.get_lookup())
+
+        logger.debug(f"df restricted to {len(dates)} dates")
+
+        return df_dates
+
+    def get_window(self, start=None, end=None):
+        """Get the dates bounding a selection : start included, end excluded
+
+        Args:
+            start (datetime, optional): minimal date. Defaults to the first date of the dataset.
+            end (datetime, optional): maximal date. Defaults to after the last date of the dataset.
+
+        Returns:
+            (pd.Timestamp, pd.Timestamp): start and end
+        """
+
+        index = self.data_serve(only_index=True)
+
+        start = pd.Timestamp(start) if start else index.min()
+        end = pd.Timestamp(end) if end else index.max() + timedelta(seconds=1)
+
+        return start, end
+
+    def get_forecast_prefix(self, model):
+        """Prefix of the name of the forecasts files of a model, for its fit and the version of the dataset"""
+        return f"{model.name}-{model.fingerprint[:16]}-{self.version[:16]}-"
+
+    def forecast_load(self, model, start, end):
+        """Get a cached forecast of a model, from memory or from disk
+
+        A forecast covering a larger window is sliced to the requested one. The stored forecast of
+        the whole dataset is used if it comes from the same fit and the same version of the dataset.
+
+        Args:
+            model (ModelProphet): fitted model
+            start (pd.Timestamp): start of the window
+            end (pd.Timestamp): end of the window, excluded
+
+        Returns:
+            pd.DataFrame: forecast, None if no cached forecast covers the window
+        """
+
+        if not model.fingerprint or not self.version:
+            return None
+
+        prefix = (model.name, model.fingerprint, self.version)
+
+        # The forecasts in memory
+        _, forecast = self.forecasts.find(lambda key: key[:3] == prefix and key[3] <= start and key[4] >= end)
+
+        # The forecast of the whole dataset, if it is up to date : a range query
+        if forecast is None and self.get_history_version(model.name)[:2] == (model.fingerprint, self.version):
+            forecast = self.backends_history[model.name].load(start=start, end=end).reset_index().rename(columns={"longdate" : "ds"})
+            self.forecasts.set(prefix + (start, end), forecast)
+
+        # The forecasts on disk, named after their window
+        if forecast is None and FORECAST_CACHE_FOLDER:
+
+            for path in Path(FORECAST_CACHE_FOLDER).glob(f"{self.get_forecast_prefix(model)}*.arrow"):
+
+                start_cached, end_cached = [pd.Timestamp(datetime.strptime(bound, "%Y%m%d%H%M%S")) for bound in path.stem.split("-")[-2:]]
+
+                if start_cached <= start and end_cached >= end:
+                    forecast = store.load_ipc(path)
+                    os.utime(path)
+                    self.forecasts.set(prefix + (start_cached, end_cached), forecast)
+                    break
+
+        if forecast is None:
+            return None
+
+        # The forecast is sorted by date
+        return forecast.iloc[forecast.ds.searchsorted(start):forecast.ds.searchsorted(end)].reset_index(drop=True)
+
+    def forecast_save(self, model, start, end, forecast):
+        """Cache a forecast of a model, in memory and on disk
+
+        The forecasts on disk of the previous fits of the model, or of the previous versions of
+        the dataset, are removed. Above FORECAST_CACHE_FILES forecasts of the model, the least
+        recently used ones are removed too.
+
+        Args:
+            model (ModelProphet): fitted model
+            start (pd.Timestamp): start of the window
+            end (pd.Timestamp): end of the window, excluded
+            forecast (pd.DataFrame): forecast
+        """
+
+        if not model.fingerprint or not self.version:
+            return
+
+        self.forecasts.set((model.name, model.fingerprint, self.version, start, end), forecast)
+
+        if FORECAST_CACHE_FOLDER:
+
+            prefix = self.get_forecast_prefix(model)
+
+            for path in Path(FORECAST_CACHE_FOLDER).glob(f"{model.name}-*.arrow"):
+                if not path.name.startswith(prefix):
+                    path.unlink(missing_ok=True)
+
+            # Written then renamed, so that the other processes never read a partial file
+            path = Path(FORECAST_CACHE_FOLDER, f"{prefix}{start:%Y%m%d%H%M%S}-{end:%Y%m%d%H%M%S}.arrow")
+            path_tmp = path.with_suffix(f".{os.getpid()}.tmp")
+
+            store.save_ipc(forecast, path_tmp)
+            os.replace(path_tmp, path)
+
+            # The files are used in the order of their modification time, renewed when they are loaded
+            paths = sorted(Path(FORECAST_CACHE_FOLDER).glob(f"{prefix}*.arrow"), key=lambda path: path.stat().st_mtime)
+
+            for path in paths[:-FORECAST_CACHE_FILES]:
+                path.unlink(missing_ok=True)
+
+    def get_model(self, model_name):
+        """Get a model, loaded from its pkl file or trained if necessary
+
+        Args:
+            model_name (str): name of the model
+
+        Returns:
+            ModelProphet: model
+        """
+
         # Get the model
         model = self.models.get(model_name).get("model")
         
@@ -351,13 +998,148 @@ class Pipeline():
         else:
             logger.info(f"{model_name} is loaded and trained")
 
+        return model
+
+    def get_history_version(self, model_name):
+        """Get the fit and the version of the dataset of the stored forecast of a model
+
+        Args:
+            model_name (str): name of the model
+
+        Returns:
+            (str, str, str): fingerprint of the model, version and base version of the dataset, (None, None, None) if there is no stored forecast
+        """
+
+        path = self.paths_history_version[model_name]
+
+        if not path.exists():
+            return None, None, None
+
+        # The forecasts stored before the base versions have none
+        fingerprint, version, *base = path.read_text().split()
+
+        return fingerprint, version, base[0] if base else None
+
+    def forecast_history(self, model, batch_days=FORECAST_BATCH_DAYS):
+        """Predict the whole dataset with a model and store the forecast next to the dataset
+
+        The dataset is predicted in batches of batch_days. If the stored forecast comes from the
+        same fit of the model, and the dataset was only appended to since, only the dates after it
+        are predicted and appended.
+
+        Args:
+            model (ModelProphet): fitted model
+            batch_days (int, optional): days predicted at once. Defaults to FORECAST_BATCH_DAYS.
+        """
+
+        backend = self.backends_history[model.name]
+        fingerprint, _, base = self.get_history_version(model.name)
+
+        # Only the new dates are predicted for the same fit, if the stored dates didn't change since :
+        # the dataset was not built again, only updated
+        self.data_version()
+        appended = fingerprint == model.fingerprint and base == self.version_base
+        watermark = backend.load_watermark() if appended else None
+
+        index = self.data_serve(only_index=True)
+        index = index[index > watermark] if watermark is not None else index
+
+        forecasts = []
+
+        if not index.empty:
+
+            for start in pd.date_range(index.min(), index.max(), freq=f"{batch_days}D"):
+
+                df_batch = self.data_serve(start=start, end=start + timedelta(days=batch_days), columns=model.columns_base)
+                df_batch = df_batch.iloc[df_batch.index > watermark] if watermark is not None else df_batch
+
+                if df_batch.empty:
+                    continue
+
+                forecasts.append(model.test(df_batch))
+
+                logger.debug(f"{model.name} : {len(df_batch)} dates predicted from {start}")
+
+            df_forecast = pd.concat(forecasts).set_index("ds").rename_axis("longdate")
+            df_forecast = df_forecast.select_dtypes("number")
+
+            if watermark is not None:
+                backend.upsert(df_forecast)
+            else:
+                backend.save(df_forecast)
+
+        self.paths_history_version[model.name].write_text(f"{model.fingerprint} {self.version} {self.version_base}")
+
+        logger.info(f"{len(index)} dates predicted by {model.name} and stored")
+
+    def forecast_histories(self, stored=False):
+        """Predict the whole dataset with all the models and store the forecasts
+
+        Args:
+            stored (bool, optional): only extend the stored forecasts, with the models already trained
+                or saved : none is trained. Defaults to False.
+        """
+
+        for model_name, parameters in self.models.items():
+
+            if stored:
+
+                # Nothing to extend without a stored forecast
+                if not self.paths_history_version[model_name].exists():
+                    continue
+
+                # The models are built by the caller, unless the dataset is updated first
+                if parameters.get("model") is None:
+                    self.build_models()
+
+                model = parameters.get("model")
+
+                if not model.trained:
+                    try:
+                        model.load()
+
+                    except Exception as exce:
+                        logger.warning(f"{model_name} couldn't be loaded, its stored forecast is not extended")
+                        continue
+
+            else:
+                model = self.get_model(model_name)
+
+            if model.trained:
+                self.forecast_history(model)
+
+    def data_test(self, start=None, end=None, extra_columns=[],  model_name=None):
+        """_summary_
+
+        Args:
+            start (_type_, optional): _description_. Defaults to None.
+            end (_type_, optional): _description_. Defaults to None.
+            extra_columns (list, optional): _description_. Defaults to [].
+            model_name (_type_, optional): _description_. Defaults to None.
+
+        Returns:
+            _type_: _description_
+        """
+       
+        # Get the model
+        model = self.get_model(model_name)
+
         columns = model.columns_base + extra_columns
 
         # Get the test data
         df_test = self.data_serve(start=start, end=end, columns=columns, only_index=False)
 
-        # Make a prediction
-        forecast = model.test(df_test)
+        # Get the prediction from the cache, or make it
+        start, end = self.get_window(start=start, end=end)
+        forecast = self.forecast_load(model, start, end)
+
+        if forecast is None:
+            forecast = model.test(df_test)
+            self.forecast_save(model, start, end, forecast)
+
+        else:
+            model.df_test = model.prepare_df_for_prophet(df_test)
+            logger.info(f"forecast of {model_name} served from the cache")
 
         # Return prediction and model
         return forecast, model
@@ -375,6 +1157,34 @@ if __name__ == "__main__":
                     action='store_true',
                     help='download the datasets from the web')
 
+    parser.add_argument('-i', "--incremental",
+                    action='store_true',
+                    help='with update, only append the new data to the stored dataset')
+
+    parser.add_argument('-f', "--data-from",
+                    type=str,
+                    default="csv",
+                    choices=["csv", "api"],
+                    help='update the dataset from the csv files or from the api')
+
+    parser.add_argument('-w', "--workers",
+                    type=int,
+                    default=1,
+                    help='number of processes reading and cleaning the datasets, 1 by default')
+
+    parser.add_argument('-l', "--lazy",
+                    action='store_true',
+                    help='serve the data from the storage backend instead of holding it in memory')
+
+    parser.add_argument('-tw', "--train-workers",
+                    type=int,
+                    default=1,
+                    help='number of models trained at once in worker processes, 1 by default')
+
+    parser.add_argument('-p', "--predict-history",
+                    action='store_true',
+                    help='predict the whole dataset with each model and store the forecasts')
+
     parser.add_argument('-sd', "--start-date",            
                     type=lambda s: datetime.strptime(s, '%Y-%m-%dT%H:%M'),
                     help='date in the YYYY-mm-ddTHH:MM format ')
@@ -396,14 +1206,19 @@ if __name__ == "__main__":
     args = parser.parse_args()
 
    # Build the pipeline
-    pip = Pipeline()
-    pip.data_process(update=args.update, download=args.download, data_from="csv")
+    pip = Pipeline(lazy=args.lazy)
+    pip.data_process(update=args.update, download=args.download, data_from=args.data_from, workers=args.workers, incremental=args.incremental)
     pip.build_models()
 
     # Train the models if asked
     if args.train_models:
 
-        pip.train_models()
+        pip.train_models(workers=args.train_workers)
+
+    # Predict the whole dataset if asked (done by the training otherwise)
+    elif args.predict_history:
+
+        pip.forecast_histories()
 
     # If a date is given, make a prediction
     if args.start_date:
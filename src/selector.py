@@ -1,3 +1,6 @@
+# Libraries
+import pandas as pd
+import numpy as np
 
 def get_columns(df, columns=[]):
     """Select columns of the dataframe 
@@ -12,34 +15,162 @@ def get_columns(df, columns=[]):
     # If columns are given, we return only the selected columns of the dataframe. Otherwise, the full dataframe is returned
     return df.loc[:, columns] if columns else df
 
-def get_dates(df, start=None, end=None, date=None):
+def get_positions(index, start=None, end=None):
+    """Find the positions of a date range in a sorted index, by binary search
+
+    Args:
+        index (pd.DatetimeIndex): sorted index
+        start (datetime, optional): minimal date, included. Defaults to None.
+        end (datetime, optional): maximal date, excluded. Defaults to None.
+
+    Returns:
+        slice: positions of the range in the index
+    """
+
+    # The dates are searched on the int64 nanoseconds of the index
+    values = index.values.view("int64")
+
+    first = values.searchsorted(pd.Timestamp(start).value, side="left") if start else 0
+    last = values.searchsorted(pd.Timestamp(end).value, side="left") if end else len(values)
+
+    return slice(first, max(first, last))
+
+def get_lookup(index, freq="H"):
+    """Build a lookup of the positions of a regular index : date -> row
+
+    The dates of the index are on a grid of step freq, possibly with missing steps. The
+    position of a date is read from an array indexed by its offset from the first date, in steps.
+
+    Args:
+        index (pd.DatetimeIndex): sorted index, without duplicates
+        freq (str, optional): step of the grid. Defaults to "H".
+
+    Returns:
+        dict: first date and step in nanoseconds, positions of the steps (-1 if missing).
+        None if the index is not on the grid.
+    """
+
+    values = index.values.view("int64")
+    step = pd.tseries.frequencies.to_offset(freq).nanos
+
+    if not len(values) or not index.is_monotonic_increasing or not index.is_unique:
+        return None
+
+    offsets = values - values[0]
+
+    if (offsets % step).any():
+        return None
+
+    positions = np.full(offsets[-1] // step + 1, -1, dtype="int64")
+    positions[offsets // step] = np.arange(len(values))
+
+    return {"start" : values[0], "step" : step, "positions" : positions}
+
+def get_lookup_position(lookup, date):
+    """Find the position of a date with a lookup, without searching the index
+
+    Args:
+        lookup (dict): lookup given by get_lookup
+        date (datetime): date
+
+    Returns:
+        int: position of the date in the index, -1 if missing
+    """
+
+    offset = pd.Timestamp(date).value - lookup["start"]
+    step, remainder = divmod(offset, lookup["step"])
+
+    # Only a date on the grid, and inside it, is found
+    if offset < 0 or remainder or step >= len(lookup["positions"]):
+        return -1
+
+    return int(lookup["positions"][step])
+
+def get_lookup_positions(lookup, dates):
+    """Find the positions of dates with a lookup, without searching the index
+
+    Args:
+        lookup (dict): lookup given by get_lookup
+        dates (array-like): dates
+
+    Returns:
+        np.array: positions of the dates in the index, -1 if missing
+    """
+
+    offsets = pd.DatetimeIndex(pd.to_datetime(dates)).values.view("int64") - lookup["start"]
+    steps = offsets // lookup["step"]
+
+    # Only the dates on the grid, and inside it, are found
+    found = (offsets >= 0) & (offsets % lookup["step"] == 0) & (steps < len(lookup["positions"]))
+
+    positions = np.full(len(offsets), -1, dtype="int64")
+    positions[found] = lookup["positions"][steps[found]]
+
+    return positions
+
+def get_dates_at(df, dates, lookup=None):
+    """Select the rows of many dates at once
+
+    Args:
+        df (pd.DataFrame): dataframe
+        dates (array-like): dates
+        lookup (dict, optional): lookup of the index given by get_lookup. Defaults to None.
+
+    Returns:
+        pd.DataFrame: rows of the dates found in the dataframe, in the order of the dates
+    """
+
+    if lookup is None:
+        positions = df.index.get_indexer(pd.to_datetime(dates))
+    else:
+        positions = get_lookup_positions(lookup, dates)
+
+    return df.iloc[positions[positions >= 0]]
+
+def get_dates(df, start=None, end=None, date=None, lookup=None):
     """Select indexes of the dataframe according to the input variables
 
     * if only start is given, the end date will be the maximal date of the index
     * if only end is given, the start date will be the minimal date of the index
     * if a date is given, the date is searched in the dataframe
 
+    A range of a sorted index is found by binary search and returned as a positional slice,
+    without copying the dataframe. An unsorted index falls back to a boolean mask.
+    A date is found with the lookup of the index if given, without scanning.
+
     Args:
         df (pd.DataFrame): dataframe
         start (datetime, optional): minimal date to find. Defaults to None.
         end (datetime, optional): maximal date to find. Defaults to None.
         date (datetime, optional): date. Defaults to None.
+        lookup (dict, optional): lookup of the index given by get_lookup. Defaults to None.
 
     Returns:
         pd.DataFrame: selected part of the dataframe
     """
 
-    # Start and end are given
-    if (start) and (end):
-        return df.iloc[(df.index < end) & (df.index >= start)] 
-    # Only end is given
-    elif (not start) and (end):
-        return df.iloc[df.index < end] 
-    # Only start is given
-    elif (start) and (not end):
-        return df.iloc[df.index >= start] 
+    # Start or end are given
+    if (start) or (end):
+
+        # The binary search needs a sorted index (checked once, then cached by pandas)
+        if df.index.is_monotonic_increasing:
+            return df.iloc[get_positions(df.index, start=start, end=end)]
+
+        mask = np.ones(len(df), dtype=bool)
+
+        if start:
+            mask &= df.index >= start
+        if end:
+            mask &= df.index < end
+
+        return df.iloc[mask]
     # A deta is given
     elif date:
+
+        if lookup is not None:
+            position = get_lookup_position(lookup, date)
+            return df.iloc[position:position + 1] if position >= 0 else df.iloc[:0]
+
         return df.iloc[df.index == date] 
     # If nothing is given, we return the dataframe without selection
     else:
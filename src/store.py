@@ -2,13 +2,52 @@
 import pickle
 from pathlib import Path
 import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyarrow.feather as feather
+import os
+import time
+import uuid
+import shutil
+import threading
+from contextlib import contextmanager
 from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
+from sqlalchemy import text
 import logging
 
+# Modules
+import selector
+
+# Constants
+from config import SQL_POOL_SIZE
+from config import SQL_POOL_MAX_OVERFLOW
+from config import SQL_POOL_TIMEOUT
+
 logger = logging.getLogger("journal")
 
+# Engines of the process and their statistics, by database path
+engines = {}
+engines_stats = {}
+engines_lock = threading.Lock()
+
+def compact(df, dtype="float32"):
+    """Represent the columns of a dataframe as a single contiguous 2-D block
+
+    Args:
+        df (pd.DataFrame): dataframe with numeric columns
+        dtype (str, optional): dtype of the block. Defaults to "float32".
+
+    Returns:
+        pd.DataFrame: dataframe backed by the block
+    """
+    return pd.DataFrame(np.ascontiguousarray(df.to_numpy(dtype=dtype)), index=df.index, columns=df.columns)
+
 def get_engine(path):
-    """Get a sql engine
+    """Get the sql engine of a database, shared by the whole process
+
+    The engine is created at the first call for a database, with a pool of connections.
 
     Args:
         path (str, Pathlib): path to the database to open 
@@ -17,70 +56,651 @@ def get_engine(path):
         engine: engine
     """
 
-    #Conversion to a string if necessary
-    if isinstance(path, Path):
-        path = str(path)
+    # The same database is always registered under the same key
+    path = str(Path(path).resolve())
+
+    with engines_lock:
+
+        if path not in engines:
+
+            engines[path] = create_engine(f'sqlite:///{path}',
+                poolclass=QueuePool,
+                pool_size=SQL_POOL_SIZE,
+                max_overflow=SQL_POOL_MAX_OVERFLOW,
+                pool_timeout=SQL_POOL_TIMEOUT,
+                connect_args={"check_same_thread" : False})
+
+            engines_stats[path] = {"checkouts" : 0, "wait" : 0.0}
+
+            logger.debug(f"engine created for {path}")
+
+        return engines[path]
+
+@contextmanager
+def connect(path, raw=False):
+    """Check out a connection from the pool of a database, and give it back afterwards
+
+    The number of checkouts and the time spent waiting for a connection are counted.
+
+    Args:
+        path (str, Pathlib): path to the database
+        raw (bool, optional): get the raw DBAPI connection instead of a SQLAlchemy one. Defaults to False.
+
+    Yields:
+        connection: connection
+    """
+
+    engine = get_engine(path)
+
+    start = time.perf_counter()
+    sql_connection = engine.raw_connection() if raw else engine.connect()
+    wait = time.perf_counter() - start
+
+    with engines_lock:
+        stats = engines_stats[str(Path(path).resolve())]
+        stats["checkouts"] += 1
+        stats["wait"] += wait
+
+    try:
+        yield sql_connection
+
+    finally:
+        sql_connection.close()
+
+def get_engines_stats():
+    """Get the statistics of the engines of the process
+
+    Returns:
+        dict: path -> checkouts, total wait in seconds and status of the pool
+    """
+
+    with engines_lock:
+        return {
+            path : {**stats, "pool" : engines[path].pool.status()}
+            for path, stats in engines_stats.items()
+        }
+
+def dispose_engines():
+    """Drop the pooled connections inherited from the parent process
+
+    Called in a child process after a fork (gunicorn workers, process pools) : the connections
+    of the parent are left to it, the child opens its own.
+    """
+
+    for engine in engines.values():
+        engine.dispose(close=False)
+
+os.register_at_fork(after_in_child=dispose_engines)
+
+def tune_sqlite(cursor):
+    """Set the pragmas of a sqlite connection for bulk writes
+
+    * WAL journal : the database can be read while it is written
+    * synchronous NORMAL : safe with WAL, without a sync at each transaction
+    * 64 MiB page cache and temporary tables in memory
+
+    Args:
+        cursor (sqlite3.Cursor): cursor of the connection
+    """
+
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA cache_size=-65536")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+
+def to_epoch(index):
+    """Convert a DatetimeIndex to integer epochs in seconds
+
+    Args:
+        index (pd.DatetimeIndex): dates
 
-    return create_engine(f'sqlite:///{path}')
+    Returns:
+        np.array: epochs as int64
+    """
+    return index.values.astype("datetime64[s]").astype("int64")
+
+def write_rows(cursor, df, sql_table, chunksize=10000):
+    """Insert or replace the rows of a dataframe, by chunks with executemany
+
+    Args:
+        cursor (sqlite3.Cursor): cursor of the connection, in a transaction
+        df (pd.DataFrame): dataframe
+        sql_table (str): name of the table
+        chunksize (int, optional): number of rows per executemany. Defaults to 10000.
+    """
+
+    columns = ", ".join(["longdate", ] + [f'"{column}"' for column in df.columns])
+    placeholders = ", ".join(["?"] * (len(df.columns) + 1))
+    insert = f'INSERT OR REPLACE INTO "{sql_table}" ({columns}) VALUES ({placeholders})'
+
+    epochs = to_epoch(df.index)
+    values = df.to_numpy(dtype="float64")
+
+    for start in range(0, len(df), chunksize):
+        rows = zip(epochs[start:start+chunksize].tolist(), *values[start:start+chunksize].T.tolist())
+        cursor.executemany(insert, rows)
+
+def create_table(cursor, df, sql_table):
+    """Create a typed table for a dataframe, if it doesn't exist
+
+    Args:
+        cursor (sqlite3.Cursor): cursor of the connection, in a transaction
+        df (pd.DataFrame): dataframe
+        sql_table (str): name of the table
+    """
 
-def save_sql(df, path, sql_table="power", if_exists="replace"):
+    columns = ", ".join(["longdate INTEGER PRIMARY KEY", ] + [f'"{column}" REAL' for column in df.columns])
+    cursor.execute(f'CREATE TABLE IF NOT EXISTS "{sql_table}" ({columns})')
+
+def get_date_type(cursor, sql_table):
+    """Get the declared type of the longdate column of a table
+
+    The tables written by the previous versions (to_sql) store longdate as DATETIME text.
+
+    Args:
+        cursor (sqlite3.Cursor): cursor of the connection
+        sql_table (str): name of the table
+
+    Returns:
+        str: type of longdate, "" if the table doesn't exist
+    """
+
+    columns = cursor.execute(f'PRAGMA table_info("{sql_table}")').fetchall()
+
+    return next((column[2].upper() for column in columns if column[1] == "longdate"), "")
+
+def load_legacy_rows(cursor, sql_table):
+    """Load all the rows of a table written by the previous versions, whose longdate are text
+
+    Args:
+        cursor (sqlite3.Cursor): cursor of the connection
+        sql_table (str): name of the table
+
+    Returns:
+        pd.DataFrame: dataframe
+    """
+
+    rows = cursor.execute(f'SELECT * FROM "{sql_table}"').fetchall()
+    names = [description[0] for description in cursor.description]
+
+    df = pd.DataFrame.from_records(rows, columns=names, index="longdate")
+    df.index = pd.DatetimeIndex(pd.to_datetime(df.index), name="longdate")
+
+    return df.sort_index()
+
+def save_sql(df, path, sql_table="power", if_exists="replace", chunksize=10000):
     """Save a dataframe in a sql database
 
+    The table is typed : longdate is an integer epoch (seconds) primary key, the columns are REAL.
+    The rows are written by chunks with executemany, inside a single transaction : the
+    previous table stays readable until the new one is committed.
+
     Args:
         df (pd.DataFrame): dataframe
         path (Path): path to the database file
         sql_table (str, optional): name of the table. Defaults to "power".
-        if_exists (str, optional): action if the table already exists. Defaults to "replace".
+        if_exists (str, optional): "replace" the table or "append" the rows to it. Defaults to "replace".
+        chunksize (int, optional): number of rows per executemany. Defaults to 10000.
     """
 
     try:
-        # Get an engine
-        engine = get_engine(path)
-        
-        # Connect to the engine
-        with engine.connect() as sql_connection:
-            logger.debug(f"engine connected")
+        # Check out a raw sqlite connection from the pool
+        with connect(path, raw=True) as sql_connection:
+
+            try:
+                cursor = sql_connection.cursor()
+                tune_sqlite(cursor)
+
+                cursor.execute("BEGIN")
+
+                if if_exists == "replace":
+                    cursor.execute(f'DROP TABLE IF EXISTS "{sql_table}"')
 
-            # Save the database
-            df.to_sql(sql_table, sql_connection, 
-                if_exists=if_exists,
-                index_label="longdate",
-                index=True)
+                create_table(cursor, df, sql_table)
 
-            logger.debug(f"database saved to {path}")
+                write_rows(cursor, df, sql_table, chunksize=chunksize)
+
+                sql_connection.commit()
+
+            except Exception:
+                sql_connection.rollback()
+                raise
+
+        logger.debug(f"database saved to {path}")
 
     except Exception as exce:
-        logger.error(f"unable to save the database to {path}")
+        logger.error(f"unable to save the database to {path} : {exce}")
 
-def load_sql(path, sql_table="power"):
+def load_sql(path, sql_table="power", dtype=None, start=None, end=None, columns=[]):
     """Load a sql database in a dataframe
 
+    The selection is pushed down to the database : the dates become an indexed WHERE clause
+    on longdate, as selector.get_dates does (start included, end excluded), and only the
+    requested columns are read.
+
     Args:
         path (Path): path to the database file
         sql_table (str, optional): name of the table. Defaults to "power".
+        dtype (str, optional): if given, the columns are compacted to a single block of this dtype. Defaults to None.
+        start (datetime, optional): minimal date to load. Defaults to None.
+        end (datetime, optional): maximal date to load, excluded. Defaults to None.
+        columns (list, optional): columns to load. Defaults to [].
 
     Returns:
         pd.DataFrame: dataframe
     """
 
-    try:
-        # Get an engine
-        engine = get_engine(path)
+    # Build the query
+    selected = ", ".join(["longdate", ] + [f'"{column}"' for column in columns]) if columns else "*"
+    conditions = []
+    params = {}
+
+    if start is not None:
+        conditions.append("longdate >= :start")
+        params["start"] = pd.Timestamp(start)
+
+    if end is not None:
+        conditions.append("longdate < :end")
+        params["end"] = pd.Timestamp(end)
 
-        # Connect to the engine
-        with engine.connect() as sql_connection:
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    query = f'SELECT {selected} FROM "{sql_table}"{where} ORDER BY longdate'
+
+    try:
+        # Check out a connection from the pool
+        with connect(path) as sql_connection:
             logger.debug(f"engine connected to {path}")
 
-            df = pd.read_sql(sql_table, sql_connection, index_col="longdate")
+            # The dates are compared as integer epochs, or as text in the tables of the previous versions
+            if get_date_type(sql_connection.connection.cursor(), sql_table) in ("INTEGER", ""):
+                params = {key : to_epoch(pd.DatetimeIndex([value]))[0].item() for key, value in params.items()}
+            else:
+                params = {key : f"{value:%Y-%m-%d %H:%M:%S.%f}" for key, value in params.items()}
+
+            df = pd.read_sql(text(query), sql_connection, params=params, index_col="longdate")
             
             logger.debug(f"database loaded from {path}")
 
+        # The dates are stored as integer epochs, or as strings by the previous versions
+        if pd.api.types.is_integer_dtype(df.index):
+            df.index = pd.DatetimeIndex(pd.to_datetime(df.index, unit="s"), name="longdate")
+        else:
+            df.index = pd.DatetimeIndex(pd.to_datetime(df.index), name="longdate")
+
+        if dtype:
+            df = compact(df, dtype=dtype)
+
         return df
 
     except Exception as exce:
         logger.error(f"unable to load the database from {path} : {exce}")
         return pd.DataFrame()
 
+def load_index(path, sql_table="power"):
+    """Load the dates of a sql database
+
+    Args:
+        path (Path): path to the database file
+        sql_table (str, optional): name of the table. Defaults to "power".
+
+    Returns:
+        pd.DatetimeIndex: dates
+    """
+
+    try:
+        # Check out a connection from the pool
+        with connect(path) as sql_connection:
+            dates = sql_connection.execute(text(f'SELECT longdate FROM "{sql_table}" ORDER BY longdate')).scalars().all()
+
+        # The dates are stored as integer epochs, or as text by the previous versions
+        if all(isinstance(date, int) for date in dates[:1]):
+            return pd.DatetimeIndex(pd.to_datetime(np.array(dates, dtype="int64"), unit="s"), name="longdate")
+
+        return pd.DatetimeIndex(pd.to_datetime(dates), name="longdate")
+
+    except Exception as exce:
+        logger.error(f"unable to load the dates from {path} : {exce}")
+        return pd.DatetimeIndex([], name="longdate")
+
+def load_watermark(path, sql_table="power"):
+    """Get the high-water mark of a table : the last longdate stored
+
+    Args:
+        path (Path): path to the database file
+        sql_table (str, optional): name of the table. Defaults to "power".
+
+    Returns:
+        pd.Timestamp: last longdate, None if the table doesn't exist or is empty
+    """
+
+    if not Path(path).exists():
+        return None
+
+    try:
+        # Check out a connection from the pool
+        with connect(path) as sql_connection:
+            watermark = sql_connection.execute(text(f'SELECT MAX(longdate) FROM "{sql_table}"')).scalar()
+
+        if watermark is None:
+            return None
+
+        # The dates are stored as integer epochs
+        return pd.Timestamp(watermark, unit="s") if isinstance(watermark, int) else pd.Timestamp(watermark)
+
+    except Exception as exce:
+        logger.warning(f"unable to get the watermark of {sql_table} from {path} : {exce}")
+        return None
+
+def upsert_sql(df, path, sql_table="power", chunksize=10000):
+    """Insert or replace the rows of a dataframe in a sql table
+
+    The stored rows from the first longdate of the dataframe are deleted, then the rows
+    of the dataframe are written, in a single transaction. A table written by the previous
+    versions, with text dates, is rewritten in the typed layout in the same transaction.
+
+    Args:
+        df (pd.DataFrame): dataframe
+        path (Path): path to the database file
+        sql_table (str, optional): name of the table. Defaults to "power".
+        chunksize (int, optional): number of rows per executemany. Defaults to 10000.
+    """
+
+    try:
+        # Check out a raw sqlite connection from the pool
+        with connect(path, raw=True) as sql_connection:
+
+            try:
+                cursor = sql_connection.cursor()
+                tune_sqlite(cursor)
+
+                cursor.execute("BEGIN")
+
+                # A text longdate of the previous versions is always greater than an integer epoch :
+                # the table is migrated to the typed layout, keeping the stored rows before df
+                if get_date_type(cursor, sql_table) not in ("INTEGER", ""):
+                    df_stored = load_legacy_rows(cursor, sql_table)
+                    df = pd.concat([df_stored.loc[df_stored.index < df.index.min(), df.columns], df])
+
+                    cursor.execute(f'DROP TABLE "{sql_table}"')
+                    create_table(cursor, df, sql_table)
+
+                    logger.info(f"{sql_table} migrated to integer dates in {path}")
+
+                else:
+                    cursor.execute(f'DELETE FROM "{sql_table}" WHERE longdate >= ?', (int(to_epoch(df.index).min()), ))
+
+                write_rows(cursor, df, sql_table, chunksize=chunksize)
+
+                sql_connection.commit()
+
+            except Exception:
+                sql_connection.rollback()
+                raise
+
+        logger.debug(f"{len(df)} rows upserted to {path}")
+
+    except Exception as exce:
+        logger.error(f"unable to upsert the rows to {path} : {exce}")
+
+class Backend():
+    """Interface of the storages of the expanded dataset
+
+    Args:
+        path (Path): location of the storage
+        table (str, optional): name of the dataset. Defaults to "expanded".
+    """
+    def __init__(self, path, table="expanded"):
+
+        self.path = Path(path)
+        self.table = table
+
+    def save(self, df):
+        """Replace the stored dataset"""
+        raise NotImplementedError
+
+    def load(self, dtype=None, start=None, end=None, columns=[]):
+        """Load the dataset, or only a range of dates and some columns"""
+        raise NotImplementedError
+
+    def load_index(self):
+        """Load the dates of the dataset"""
+        raise NotImplementedError
+
+    def load_watermark(self):
+        """Get the last date of the dataset, None if there is no dataset"""
+        raise NotImplementedError
+
+    def upsert(self, df):
+        """Replace the stored rows from the first date of df by the rows of df"""
+        raise NotImplementedError
+
+
+class BackendSql(Backend):
+    """Storage of the dataset in a table of a sqlite database
+    """
+
+    def save(self, df):
+        save_sql(df, self.path, sql_table=self.table, if_exists="replace")
+
+    def load(self, dtype=None, start=None, end=None, columns=[]):
+        return load_sql(self.path, sql_table=self.table, dtype=dtype, start=start, end=end, columns=columns)
+
+    def load_index(self):
+        return load_index(self.path, sql_table=self.table)
+
+    def load_watermark(self):
+        return load_watermark(self.path, sql_table=self.table)
+
+    def upsert(self, df):
+        upsert_sql(df, self.path, sql_table=self.table)
+
+
+class BackendParquet(Backend):
+    """Storage of the dataset in parquet files partitioned by year and month
+
+    The files are laid out as <path>/<version>/year=YYYY/month=MM/data.parquet, and the file
+    <path>/current names the version read. A save writes a new version, then replaces the
+    pointer file in a single rename. When loading, the version is resolved once, the partitions
+    outside of the requested dates are skipped, only the requested columns are read and the
+    files are memory-mapped, so that several processes share the page cache.
+
+    Args:
+        path (Path): folder of the dataset
+        table (str, optional): name of the dataset. Defaults to "expanded".
+        compression (str, optional): parquet compression. Defaults to "snappy".
+    """
+    def __init__(self, path, table="expanded", compression="snappy"):
+
+        super().__init__(path, table=table)
+        self.compression = compression
+        self.path_current = Path(self.path, "current")
+
+    def get_root(self):
+        """Folder of the current version of the dataset
+
+        The datasets saved before the versions have their partitions directly in path.
+        """
+
+        try:
+            return Path(self.path, self.path_current.read_text().strip())
+
+        except FileNotFoundError:
+            return self.path
+
+    def get_partition_path(self, year, month, root=None):
+        """Path of the file of a partition"""
+        return Path(root or self.get_root(), f"year={year}", f"month={month:02d}", "data.parquet")
+
+    def get_partitions(self, root=None):
+        """Sorted list of the stored partitions as (year, month, path)"""
+
+        partitions = []
+
+        for path in Path(root or self.get_root()).glob("year=*/month=*/data.parquet"):
+            year = int(path.parent.parent.name.split("=")[1])
+            month = int(path.parent.name.split("=")[1])
+            partitions.append((year, month, path))
+
+        return sorted(partitions)
+
+    def write_partition(self, df, path):
+        """Write a partition to a temporary file, then move it to its path"""
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path_tmp = path.with_suffix(".tmp")
+
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=True), path_tmp, compression=self.compression)
+        os.replace(path_tmp, path)
+
+    def save(self, df):
+
+        # The dataset is written to a new version, then the pointer file is replaced at once :
+        # a concurrent load reads either the previous version or the new one
+        root_previous = self.get_root()
+        version = f"v-{uuid.uuid4().hex}"
+
+        for (year, month), df_month in df.groupby([df.index.year, df.index.month]):
+            self.write_partition(df_month, self.get_partition_path(year, month, root=Path(self.path, version)))
+
+        path_tmp = self.path_current.with_suffix(".tmp")
+        path_tmp.write_text(version)
+        os.replace(path_tmp, self.path_current)
+
+        # The previous version is kept for the loads still reading it, the older ones are removed
+        kept = {self.path_current.name, version, root_previous.name}
+
+        for path in self.path.iterdir():
+
+            if path.name in kept or (root_previous == self.path and path.name.startswith("year=")):
+                continue
+
+            if path.is_dir():
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                path.unlink()
+
+        logger.debug(f"dataset saved to {Path(self.path, version)}")
+
+    def load(self, dtype=None, start=None, end=None, columns=[]):
+
+        # Partition pruning : only the months overlapping the dates are read
+        first = (pd.Timestamp(start).year, pd.Timestamp(start).month) if start is not None else None
+        last = (pd.Timestamp(end).year, pd.Timestamp(end).month) if end is not None else None
+
+        tables = [
+            pq.read_table(path, columns=["longdate", ] + list(columns) if columns else None, memory_map=True)
+            for year, month, path in self.get_partitions()
+            if (first is None or (year, month) >= first) and (last is None or (year, month) <= last)
+        ]
+
+        # No partition in the dates : an empty dataset, with the columns stored if none are requested
+        if not tables:
+            partitions = self.get_partitions()
+
+            if not columns and partitions:
+                columns = [name for name in pq.read_schema(partitions[0][2]).names if name != "longdate"]
+
+            return pd.DataFrame(columns=columns, index=pd.DatetimeIndex([], name="longdate"), dtype=dtype or "float64")
+
+        df = pa.concat_tables(tables).to_pandas()
+        df = selector.get_dates(df, start=start, end=end)
+
+        logger.debug(f"dataset loaded from {len(tables)} partitions of {self.path}")
+
+        return compact(df, dtype=dtype) if dtype else df
+
+    def load_index(self):
+
+        tables = [pq.read_table(path, columns=["longdate", ], memory_map=True) for _, _, path in self.get_partitions()]
+
+        if not tables:
+            return pd.DatetimeIndex([], name="longdate")
+
+        return pa.concat_tables(tables).to_pandas().index
+
+    def load_watermark(self):
+
+        partitions = self.get_partitions()
+
+        if not partitions:
+            return None
+
+        # The last date is in the last partition
+        return pq.read_table(partitions[-1][2], columns=["longdate", ], memory_map=True).to_pandas().index.max()
+
+    def upsert(self, df):
+
+        start = df.index.min()
+        root = self.get_root()
+
+        # The stored partitions from the first date, and the partitions of the new rows
+        months = {(year, month) for year, month, _ in self.get_partitions(root=root) if (year, month) >= (start.year, start.month)}
+        months |= set(zip(df.index.year, df.index.month))
+
+        for year, month in sorted(months):
+
+            path = self.get_partition_path(year, month, root=root)
+            df_new = df.iloc[(df.index.year == year) & (df.index.month == month)]
+
+            if path.exists():
+                df_stored = pq.read_table(path, memory_map=True).to_pandas()
+                df_new = pd.concat([df_stored.iloc[df_stored.index < start], df_new])
+
+            if df_new.empty:
+                os.remove(path)
+            else:
+                self.write_partition(df_new, path)
+
+        logger.debug(f"{len(df)} rows upserted to {self.path}")
+
+
+def get_backend(name, path, table="expanded"):
+    """Get a storage backend by its name
+
+    Args:
+        name (str): "sqlite" or "parquet"
+        path (Path): location of the storage
+        table (str, optional): name of the dataset. Defaults to "expanded".
+
+    Returns:
+        Backend: backend
+    """
+
+    backends = {
+        "sqlite" : BackendSql,
+        "parquet" : BackendParquet,
+    }
+
+    return backends.get(name)(path, table=table)
+
+def save_ipc(df, path):
+    """Save a dataframe in an uncompressed Arrow IPC file
+
+    Args:
+        df (pd.DataFrame): dataframe
+        path (Path): path to the Arrow IPC file
+    """
+
+    feather.write_feather(df, path, compression="uncompressed")
+
+    logger.debug(f"dataframe saved to {path}")
+
+def load_ipc(path):
+    """Load a dataframe from a memory-mapped Arrow IPC file
+
+    Args:
+        path (Path): path to the Arrow IPC file
+
+    Returns:
+        pd.DataFrame: dataframe
+    """
+
+    df = feather.read_feather(path, memory_map=True)
+
+    logger.debug(f"dataframe loaded from {path}")
+
+    return df
+
 def save_model(model, name, folder=None):
     """Save the Prophet model in a pkl file
 
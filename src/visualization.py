@@ -4,11 +4,108 @@ import numpy as np
 from fbprophet.plot import plot_components_plotly
 from plotly.subplots import make_subplots
 
+# Constants
+from config import PLOT_POINTS
+from config import PLOT_DOWNSAMPLING
+from config import PLOT_DECIMALS
+
 class Visualization():
 
-    def __init__(self):
+    def __init__(self, points=PLOT_POINTS, downsampling=PLOT_DOWNSAMPLING):
         
         self.template = "plotly_white"
+        self.points = points
+        self.downsampling = downsampling
+
+    def lttb(self, x, y, points):
+        """Positions of the points kept by Largest-Triangle-Three-Buckets
+
+        The first and the last points are kept. The other points are split in points - 2 buckets,
+        and each bucket keeps the point forming the largest triangle with the point kept in the
+        previous bucket and the average of the next bucket.
+        """
+
+        n = len(x)
+
+        # Bounds of the buckets, and average of each bucket
+        edges = np.linspace(1, n - 1, points - 1).astype("int64")
+        sizes = np.diff(edges)
+
+        # The last sum of reduceat runs to the end of the array : it is dropped
+        x_mean = np.append(np.add.reduceat(x, edges)[:-1] / sizes, x[-1])
+        y_mean = np.append(np.add.reduceat(y, edges)[:-1] / sizes, y[-1])
+
+        positions = np.empty(points, dtype="int64")
+        positions[0], positions[-1] = 0, n - 1
+
+        for bucket in range(points - 2):
+
+            start, end = edges[bucket], edges[bucket + 1]
+            x_a, y_a = x[positions[bucket]], y[positions[bucket]]
+            x_c, y_c = x_mean[bucket + 1], y_mean[bucket + 1]
+
+            # Twice the area of the triangles, for all the points of the bucket at once
+            areas = np.abs((x_a - x_c) * (y[start:end] - y_a) - (x_a - x[start:end]) * (y_c - y_a))
+
+            positions[bucket + 1] = start + areas.argmax()
+
+        return positions
+
+    def minmax(self, x, y, points):
+        """Positions of the points kept by min/max decimation
+
+        The range of x is split in (points - 2) // 2 buckets of the same width, as pixels. Each bucket
+        keeps its minimum and its maximum, and the first and the last points are kept : at most
+        points positions from a budget of 4 points.
+        """
+
+        n = len(x)
+        buckets = max((points - 2) // 2, 1)
+
+        bucket_ids = ((x - x[0]) / (x[-1] - x[0] or 1) * buckets).astype("int64").clip(0, buckets - 1)
+
+        # Sorted by bucket then by value : the first of a bucket is its minimum, the last its maximum
+        order = np.lexsort((y, bucket_ids))
+        bounds = np.flatnonzero(np.diff(bucket_ids[order]))
+
+        return np.unique(np.concatenate([[0, n - 1], order[np.append(0, bounds + 1)], order[np.append(bounds, n - 1)]]))
+
+    def downsample(self, x, y, points=None, method=None):
+        """Downsample a trace to a budget of points, keeping its peaks
+
+        Args:
+            x (array-like): x values, numbers or dates, sorted
+            y (array-like): y values
+            points (int, optional): budget of points. Defaults to the budget of the instance.
+            method (str, optional): "lttb", "minmax" or None to keep all the points. Defaults to the method of the instance.
+
+        Returns:
+            (array-like, array-like): x and y values kept, of the same types as given
+        """
+
+        points = points or self.points
+        method = method if method is not None else self.downsampling
+
+        x_values = np.asarray(x)
+        y_values = np.asarray(y, dtype="float64")
+
+        if not method or len(x_values) <= max(points, 3):
+            return x, y
+
+        # Dates are handled as int64 nanoseconds, the missing values are skipped
+        x_values = (x_values.view("int64") if x_values.dtype.kind == "M" else x_values).astype("float64")
+        valid = np.flatnonzero(np.isfinite(y_values))
+
+        if len(valid) <= max(points, 3):
+            positions = valid
+        elif method == "minmax":
+            positions = valid[self.minmax(x_values[valid], y_values[valid], points)]
+        else:
+            positions = valid[self.lttb(x_values[valid], y_values[valid], points)]
+
+        take = lambda values: values.take(positions) if hasattr(values, "take") else np.asarray(values)[positions]
+
+        return take(x), take(y)
 
     def reorganize_components(self, components):
 
@@ -56,6 +153,46 @@ class Visualization():
             hole=hole        
         ) 
 
+    def go_pie(self, labels=None, values=None, hole=0.3, decimals=PLOT_DECIMALS):
+
+        return go.Pie(
+            labels=labels,
+            values=np.round(np.asarray(values, dtype="float64"), decimals),
+            hole=hole,
+        )
+
+    def go_lines_columns(self, df, points=None, decimals=PLOT_DECIMALS):
+        """One line per column of a dataframe, built from its arrays without melting it
+
+        The dates are sent as epoch milliseconds, shared by all the columns unless they are
+        downsampled, and the values are rounded so that their encoding stays short.
+
+        Args:
+            df (pd.DataFrame): dataframe with a DatetimeIndex
+            points (int, optional): budget of points of each line. Defaults to the budget of the instance.
+            decimals (int, optional): decimals of the values. Defaults to PLOT_DECIMALS.
+
+        Returns:
+            list: go.Scatter of each column
+        """
+
+        x = df.index.values.view("int64") // 10**6
+
+        lines = []
+
+        for column in df.columns:
+
+            x_column, y_column = self.downsample(x, df[column].values, points=points)
+
+            lines.append(go.Scatter(
+                x=x_column,
+                y=np.round(y_column.astype("float64"), decimals),
+                name=column,
+                mode="lines",
+            ))
+
+        return lines
+
     def px_lines(self, df=None, x=None, y=None, color=None):
 
         return px.line(
@@ -65,15 +202,20 @@ class Visualization():
             color=color
         )
 
-    def go_lines(self, df=None, x=None, y=None, color=None, reverse_last=False, name=None, fill=None, mode="lines"):
+    def go_lines(self, df=None, x=None, y=None, color=None, reverse_last=False, name=None, fill=None, mode="lines", points=None):
 
         if reverse_last:
 
+            x, y = map(list, zip(*[self.downsample(x_part, y_part, points=points) for x_part, y_part in zip(x, y)]))
+
             x[-1] = x[-1][::-1]
             y[-1] = y[-1][::-1]
 
             x = np.concatenate(x)
             y = np.concatenate(y)
+
+        else:
+            x, y = self.downsample(x, y, points=points)
         
         return go.Scatter(
             x=x,
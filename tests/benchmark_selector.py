@@ -0,0 +1,85 @@
+"""Benchmark of the date ranges : boolean mask against the binary search of selector.get_dates
+
+Usage:
+    python tests/benchmark_selector.py
+
+A 10-year hourly float32 dataset of 16 columns is generated, and a 3-month range is selected.
+"""
+
+# Libraries
+import sys
+import time
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+# Modules
+import selector
+
+def get_dates_mask(df, start=None, end=None):
+    """Previous selection of a date range, by a boolean mask on the whole index
+
+    Args:
+        df (pd.DataFrame): dataframe
+        start (datetime, optional): minimal date, included. Defaults to None.
+        end (datetime, optional): maximal date, excluded. Defaults to None.
+
+    Returns:
+        pd.DataFrame: selected part of the dataframe
+    """
+
+    if start and end:
+        return df.iloc[(df.index < end) & (df.index >= start)]
+    elif end:
+        return df.iloc[df.index < end]
+    elif start:
+        return df.iloc[df.index >= start]
+
+    return df
+
+def per_call(function, calls=200):
+    """Run a function several times
+
+    Args:
+        function (callable): function
+        calls (int, optional): number of calls. Defaults to 200.
+
+    Returns:
+        (float, object): mean duration of a call in milliseconds and last result
+    """
+
+    start = time.perf_counter()
+
+    for _ in range(calls):
+        result = function()
+
+    return (time.perf_counter() - start) * 1e3 / calls, result
+
+def main():
+
+    index = pd.date_range("2013-01-01", "2023-01-01", freq="H", name="longdate")
+    df = pd.DataFrame(np.random.default_rng(0).random((len(index), 16), dtype="float32"), index=index)
+
+    # Open, closed, empty, reversed and sub-hour ranges give the same rows
+    ranges = [
+        ("2018-03-01", "2018-06-01"), (None, "2015-01-01"), ("2022-06-01", None), ("2030-01-01", None),
+        ("2019-01-01", "2018-01-01"), ("2018-03-01 00:30", "2018-03-01 05:30"),
+    ]
+
+    for start, end in ranges:
+        assert selector.get_dates(df, start=start, end=end).equals(get_dates_mask(df, start=start, end=end))
+
+    # get_dates is called once before timing, so that the monotonic index check is cached by pandas
+    selector.get_dates(df, start="2018-03-01", end="2018-06-01")
+
+    old, _ = per_call(lambda: get_dates_mask(df, start="2018-03-01", end="2018-06-01"))
+    new, result = per_call(lambda: selector.get_dates(df, start="2018-03-01", end="2018-06-01"))
+
+    print(f"{len(df)} rows, 16 columns, 3-month range, mean of 200 calls")
+    print(f"{'boolean mask':34s}{old:.3f} ms")
+    print(f"{'selector.get_dates (searchsorted)':34s}{new:.3f} ms, view of the dataset : {np.shares_memory(result.values, df.values)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Benchmark of the power timestamps : string concatenation and parsing against cleaner.build_timestamps
+
+Usage:
+    python tests/benchmark_timestamps.py [eco2mix-national-cons-def.csv]
+
+Without a file, a full-size eco2mix date and time grid is generated : 11 years every 15 minutes.
+"""
+
+# Libraries
+import sys
+import time
+import pandas as pd
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+# Modules
+import cleaner
+
+def get_dates_times(csv_path=None):
+    """Get the date and time columns of an eco2mix file, or of a generated full-size grid
+
+    Args:
+        csv_path (Path, optional): path of the eco2mix csv file. Defaults to None.
+
+    Returns:
+        pd.DataFrame: Date and Heure columns, as strings
+    """
+
+    if csv_path:
+        return pd.read_csv(csv_path, delimiter=";", usecols=["Date", "Heure"], dtype=str)
+
+    grid = pd.date_range("2012-01-01", "2022-12-31 23:45", freq="15min")
+
+    return pd.DataFrame({"Date" : grid.strftime("%Y-%m-%d"), "Heure" : grid.strftime("%H:%M")})
+
+def best_of(function, repeat=3):
+    """Run a function several times
+
+    Args:
+        function (callable): function
+        repeat (int, optional): number of runs. Defaults to 3.
+
+    Returns:
+        (float, object): best duration in seconds and result
+    """
+
+    best = float("inf")
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+
+    return best, result
+
+def main(csv_path=None):
+
+    df = get_dates_times(csv_path)
+    df_category = df.astype("category")
+
+    old, expected = best_of(lambda: pd.DatetimeIndex(pd.to_datetime(df.Date + " " + df.Heure)))
+    new_object, result_object = best_of(lambda: cleaner.build_timestamps(df.Date, df.Heure))
+    new_category, result_category = best_of(lambda: cleaner.build_timestamps(df_category.Date, df_category.Heure))
+
+    assert expected.equals(result_object) and expected.equals(result_category)
+
+    print(f"{len(df)} rows, best of 3")
+    print(f"pd.to_datetime(Date + ' ' + Heure)   {old:.3f} s")
+    print(f"build_timestamps on object columns   {new_object:.3f} s")
+    print(f"build_timestamps on category columns {new_category:.3f} s")
+
+if __name__ == "__main__":
+    main(*sys.argv[1:2])
@@ -0,0 +1,6 @@
+# Libraries
+import sys
+from pathlib import Path
+
+# The modules of the dashboard are imported from src, as when it runs
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
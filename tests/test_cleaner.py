@@ -0,0 +1,118 @@
+# Libraries
+import numpy as np
+import pandas as pd
+
+# Modules
+import cleaner
+import collector
+
+# Constants
+from config import COL_TEMP
+from config import COL_WEATHER
+from config import SCHEMA_CSV_TEMP
+from config import SCHEMA_CSV_WEATHER
+
+def test_build_timestamps():
+
+    grid = pd.date_range("2020-03-28", "2020-03-30 23:45", freq="15min")
+
+    dates = pd.Series(grid.strftime("%Y-%m-%d"))
+    times = pd.Series(grid.strftime("%H:%M"))
+
+    expected = pd.DatetimeIndex(pd.to_datetime(dates + " " + times))
+
+    assert cleaner.build_timestamps(dates, times).equals(expected)
+    assert cleaner.build_timestamps(dates.astype("category"), times.astype("category")).equals(expected)
+
+def test_build_timestamps_missing():
+
+    timestamps = cleaner.build_timestamps(pd.Series(["2020-01-01", None, "2020-01-02"]), pd.Series(["01:30", "02:00", None]))
+
+    assert timestamps[0] == pd.Timestamp("2020-01-01 01:30")
+    assert timestamps[1:].isna().all()
+
+def old_clean_weather(df, columns):
+    """Previous clean_weather, grouping on the date strings then formatting and parsing the dates again"""
+
+    df = df.groupby("Date").mean(numeric_only=True)
+    df.columns = ["code", "wspd", "sun"]
+    df.index.name = "longdate"
+
+    df.index = pd.DatetimeIndex(pd.to_datetime(df.index, format = '%Y-%m-%dT%H:%M:%S%z', utc=True).strftime('%Y-%m-%d %H:%M:%S'))
+    df = df.loc[:, columns]
+
+    return df.sort_index()
+
+def old_clean_temp(df, columns):
+    """Previous clean_temp, grouping on the date strings then formatting and parsing the dates again"""
+
+    df = df.groupby("Date").mean(numeric_only=True)
+    df.columns = ["code", "tmin", "tmax", "tmoy"]
+    df.index = pd.DatetimeIndex(pd.to_datetime(df.index, format = '%Y-%m-%d').strftime('%Y-%m-%d %H:%M:%S'))
+
+    df.index.name = "longdate"
+    df = df.loc[:, columns]
+
+    return df.sort_index()
+
+def get_regional(dates, columns, seed=0):
+    """Build a regional dataset in the layout of the csv files : one row per date and region, shuffled
+
+    The values are multiples of 1/4, exact in float32 as in float64.
+
+    Args:
+        dates (list): dates as strings
+        columns (list): labels of the value columns
+        seed (int, optional): seed of the values. Defaults to 0.
+
+    Returns:
+        pd.DataFrame: dataset
+    """
+
+    rng = np.random.default_rng(seed)
+    regions = [11, 24, 32, 52, 75, 84]
+
+    df = pd.DataFrame({
+        "Date" : np.repeat(dates, len(regions)),
+        "Code INSEE région" : np.tile(regions, len(dates)),
+        "Région" : "R",
+    })
+
+    for column in columns:
+        df[column] = rng.integers(0, 400, len(df)) / 4
+
+    # A few missing values, skipped by the means
+    df.iloc[rng.integers(0, len(df), 5), -1] = np.nan
+
+    return df.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+def test_clean_weather_equals_old(tmp_path):
+
+    # Every 3 hours in local time, through the change to summer time
+    local = pd.date_range("2020-03-27", "2020-04-01", freq="3H", tz="Europe/Paris")
+    dates = [date.isoformat() for date in local]
+
+    df = get_regional(dates, ["Vitesse du vent à 100m (m/s)", "Rayonnement solaire global (W/m2)"])
+
+    path = tmp_path / "weather.csv"
+    df.to_csv(path, sep=";", index=False)
+
+    expected = old_clean_weather(collector.from_csv(path), columns=COL_WEATHER)
+    result = cleaner.clean_weather(collector.from_csv(path, schema=SCHEMA_CSV_WEATHER, chunksize=50), columns=COL_WEATHER)
+
+    pd.testing.assert_frame_equal(result, expected, check_freq=False)
+
+def test_clean_temp_equals_old(tmp_path):
+
+    dates = pd.date_range("2020-01-01", "2020-03-31", freq="D").strftime("%Y-%m-%d")
+
+    df = get_regional(dates, ["TMin (°C)", "TMax (°C)", "TMoy (°C)"])
+    df.insert(0, "ID", df["Date"] + "-" + df["Code INSEE région"].astype(str))
+
+    path = tmp_path / "temp.csv"
+    df.to_csv(path, sep=";", index=False)
+
+    expected = old_clean_temp(collector.from_csv(path), columns=COL_TEMP)
+    result = cleaner.clean_temp(collector.from_csv(path, schema=SCHEMA_CSV_TEMP, chunksize=50), columns=COL_TEMP)
+
+    pd.testing.assert_frame_equal(result, expected, check_freq=False)
@@ -0,0 +1,263 @@
+# Libraries
+import json
+import threading
+import http.server
+import urllib.parse
+import numpy as np
+import pandas as pd
+import pytest
+
+# Modules
+import cleaner
+import collector
+
+# Constants
+from config import COL_TEMP
+from config import SCHEMA_API_TEMP
+from config import SCHEMA_CSV_TEMP
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    """Local server of files, answering the conditional and range requests
+
+    * 304 if If-None-Match matches the ETag of the file
+    * 206 from the start of the Range if If-Range matches, 416 if the range starts after the end
+    * 200 with the whole file otherwise
+    * /broken/<name> sends half of the file then closes the connection
+    """
+
+    files = {}
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    @staticmethod
+    def get_etag(data):
+        return f'"{len(data)}-{hash(data)}"'
+
+    def do_GET(self):
+
+        broken = self.path.startswith("/broken/")
+        data = self.files[self.path.replace("/broken/", "/")]
+        etag = self.get_etag(data)
+
+        self.requests.append({key : self.headers.get(key) for key in ("If-None-Match", "Range", "If-Range")})
+
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        start = 0
+
+        if self.headers.get("Range") and self.headers.get("If-Range") == etag:
+            start = int(self.headers.get("Range").split("=")[1].rstrip("-"))
+
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(data)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}")
+
+        else:
+            self.send_response(200)
+
+        body = data[start:]
+
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+        self.wfile.write(body[:len(body) // 2] if broken else body)
+
+class ApiHandler(http.server.BaseHTTPRequestHandler):
+    """Local server of a dataset, answering as the opendatasoft v2 api
+
+    * /records gives the number of records matching the where clause
+    * /exports/json gives a page of the records, sorted by the order_by fields
+    """
+
+    records = []
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+
+        url = urllib.parse.urlparse(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        self.requests.append(params)
+
+        records = self.records
+
+        # Only the clauses built by collector.where_since are understood
+        if "where" in params:
+            since = params["where"].split("'")[1]
+            records = [record for record in records if record["date"] >= since]
+
+        if "order_by" in params:
+            fields = params["order_by"].split(",")
+            records = sorted(records, key=lambda record: [record[field] for field in fields])
+
+        if url.path.endswith("/records"):
+            body = {"total_count" : len(records), "records" : []}
+        else:
+            offset, limit = int(params["offset"]), int(params["limit"])
+            body = [{field : record[field] for field in params["select"].split(",")} for record in records[offset:offset + limit]]
+
+        data = json.dumps(body).encode()
+
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+def serve(handler):
+    """Serve a handler on a free local port, in a thread
+
+    Args:
+        handler (class): request handler
+
+    Yields:
+        str: url of the server
+    """
+
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+    yield f"http://127.0.0.1:{httpd.server_port}"
+
+    httpd.shutdown()
+    httpd.server_close()
+
+@pytest.fixture
+def server():
+
+    Handler.files = {"/data.csv" : b"date;value\n" + b"".join(b"2020-01-%02d;%d\n" % (day, day) for day in range(1, 32)) * 100}
+    Handler.requests = []
+
+    yield from serve(Handler)
+
+@pytest.fixture
+def temp(tmp_path):
+    """Temperatures of 6 regions over 90 days, as a csv file and as the records of the api
+
+    The values are multiples of 1/4, exact in float32 as in float64.
+    """
+
+    rng = np.random.default_rng(0)
+    dates = pd.date_range("2020-01-01", periods=90, freq="D").strftime("%Y-%m-%d")
+    regions = ["11", "24", "32", "52", "75", "84"]
+
+    df = pd.DataFrame({
+        "date" : np.repeat(dates, len(regions)),
+        "code_insee_region" : np.tile(regions, len(dates)),
+        **{column : rng.integers(-40, 160, len(dates) * len(regions)) / 4 for column in COL_TEMP},
+    })
+
+    path = tmp_path / "temp.csv"
+    df.rename(columns={"date" : "Date", "code_insee_region" : "Code INSEE région", "tmin" : "TMin (°C)", "tmax" : "TMax (°C)", "tmoy" : "TMoy (°C)"}).to_csv(path, sep=";", index=False)
+
+    # The api gives the records in any order, unless sorted
+    ApiHandler.records = df.sample(frac=1, random_state=0).to_dict(orient="records")
+    ApiHandler.requests = []
+
+    return path
+
+@pytest.fixture
+def api():
+    yield from serve(ApiHandler)
+
+def test_from_web_not_modified(server, tmp_path):
+
+    path = tmp_path / "data.csv"
+
+    assert collector.from_web(f"{server}/data.csv", path)
+    assert path.read_bytes() == Handler.files["/data.csv"]
+
+    # The second download is conditional, and the file didn't change
+    assert not collector.from_web(f"{server}/data.csv", path)
+    assert Handler.requests[-1]["If-None-Match"] is not None
+    assert path.read_bytes() == Handler.files["/data.csv"]
+
+def test_from_web_interrupted_then_resumed(server, tmp_path):
+
+    path = tmp_path / "data.csv"
+    path.write_bytes(b"previous copy")
+
+    # The previous copy is only replaced by a complete download
+    with pytest.raises(Exception):
+        collector.from_web(f"{server}/broken/data.csv", path, chunk_size=1024)
+
+    offset = (tmp_path / "data.csv.part").stat().st_size
+
+    assert path.read_bytes() == b"previous copy"
+    assert 0 < offset < len(Handler.files["/data.csv"])
+
+    assert collector.from_web(f"{server}/data.csv", path)
+
+    assert Handler.requests[-1]["Range"] == f"bytes={offset}-"
+    assert path.read_bytes() == Handler.files["/data.csv"]
+    assert not (tmp_path / "data.csv.part").exists()
+
+def test_from_web_complete_part_restarted(server, tmp_path):
+
+    path = tmp_path / "data.csv"
+    data = Handler.files["/data.csv"]
+
+    # Complete .part left by a crash before its rename
+    (tmp_path / "data.csv.part").write_bytes(data)
+    collector.save_download_metadata(path, {"partial" : {"etag" : Handler.get_etag(data), "last_modified" : None}})
+
+    assert collector.from_web(f"{server}/data.csv", path)
+
+    assert [request["Range"] for request in Handler.requests] == [f"bytes={len(data)}-", None]
+    assert path.read_bytes() == data
+    assert not (tmp_path / "data.csv.part").exists()
+
+def test_from_web_all(server, tmp_path):
+
+    Handler.files["/other.csv"] = b"date;value\n2020-01-01;1\n"
+
+    paths = [tmp_path / "data.csv", tmp_path / "other.csv"]
+    urls = [f"{server}/data.csv", f"{server}/other.csv"]
+
+    assert collector.from_web_all(urls, paths) == {paths[0] : True, paths[1] : True}
+    assert collector.from_web_all(urls, paths) == {paths[0] : False, paths[1] : False}
+
+    assert json.loads((tmp_path / "other.csv.json").read_text())["etag"] is not None
+
+def test_from_api_equals_csv(api, temp):
+
+    df_api = cleaner.clean_temp(collector.from_api(f"{api}/datasets/temp", SCHEMA_API_TEMP, order_by="date,code_insee_region", page_size=50), columns=COL_TEMP)
+    df_csv = cleaner.clean_temp(collector.from_csv(temp, schema=SCHEMA_CSV_TEMP, chunksize=100), columns=COL_TEMP)
+
+    pd.testing.assert_frame_equal(df_api, df_csv, check_freq=False)
+
+    # The count, then the 11 pages of 50 records
+    assert len(ApiHandler.requests) == 1 + 11
+    assert all(params["order_by"] == "date,code_insee_region" for params in ApiHandler.requests)
+
+def test_from_api_since(api, temp):
+
+    since = pd.Timestamp("2020-03-01")
+
+    df_api = cleaner.clean_temp(collector.from_api(f"{api}/datasets/temp", SCHEMA_API_TEMP, where=collector.where_since("date", since), page_size=50), columns=COL_TEMP)
+    df_csv = cleaner.clean_temp(collector.from_csv(temp, schema=SCHEMA_CSV_TEMP, chunksize=100), columns=COL_TEMP, since=since)
+
+    pd.testing.assert_frame_equal(df_api, df_csv, check_freq=False)
+
+def test_from_api_empty(api, temp):
+
+    where = collector.where_since("date", pd.Timestamp("2030-01-01"))
+    df = cleaner.clean_temp(collector.from_api(f"{api}/datasets/temp", SCHEMA_API_TEMP, where=where), columns=COL_TEMP)
+
+    # Only the count is requested
+    assert len(ApiHandler.requests) == 1
+    assert df.empty and list(df.columns) == COL_TEMP
+    assert isinstance(df.index, pd.DatetimeIndex) and df.index.name == "longdate"
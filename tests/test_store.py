@@ -0,0 +1,91 @@
+# Libraries
+import pandas as pd
+from sqlalchemy import create_engine
+
+# Modules
+import store
+
+def get_hourly(start, periods):
+    """Build an hourly dataset with two columns
+
+    Args:
+        start (str): first date
+        periods (int): number of rows
+
+    Returns:
+        pd.DataFrame: dataset
+    """
+
+    index = pd.date_range(start, periods=periods, freq="H", name="longdate")
+
+    return pd.DataFrame({"a" : range(periods), "b" : range(periods)}, index=index, dtype="float64")
+
+def test_upsert_legacy_table(tmp_path):
+
+    path = tmp_path / "legacy.db"
+    df = get_hourly("2020-01-01", 48)
+
+    # Table written by the previous versions, with text dates
+    with create_engine(f"sqlite:///{path}").connect() as sql_connection:
+        df.iloc[:36].to_sql("expanded", sql_connection, index_label="longdate", index=True)
+
+    assert len(store.load_index(path, "expanded")) == 36
+    assert len(store.load_sql(path, "expanded", start="2020-01-01 12:00", end="2020-01-02")) == 12
+
+    store.upsert_sql(df.iloc[24:], path, sql_table="expanded")
+
+    df_stored = store.load_sql(path, "expanded")
+
+    pd.testing.assert_frame_equal(df_stored, df, check_freq=False)
+    assert store.load_watermark(path, "expanded") == df.index[-1]
+
+def test_upsert_replaces_from_first_date(tmp_path):
+
+    path = tmp_path / "typed.db"
+    df = get_hourly("2020-01-01", 48)
+
+    store.save_sql(df.iloc[:36], path, sql_table="expanded")
+    store.upsert_sql(df.iloc[24:] * 2, path, sql_table="expanded")
+
+    df_stored = store.load_sql(path, "expanded")
+
+    assert len(df_stored) == 48
+    pd.testing.assert_frame_equal(df_stored.iloc[:24], df.iloc[:24], check_freq=False)
+    pd.testing.assert_frame_equal(df_stored.iloc[24:], df.iloc[24:] * 2, check_freq=False)
+
+def test_parquet_save_versions(tmp_path):
+
+    backend = store.BackendParquet(tmp_path / "expanded")
+    df = get_hourly("2020-01-15", 24 * 60)
+
+    # Dataset saved before the versions, with its partitions directly in the folder
+    for (year, month), df_month in df.groupby([df.index.year, df.index.month]):
+        backend.write_partition(df_month, backend.get_partition_path(year, month, root=backend.path))
+
+    pd.testing.assert_frame_equal(backend.load(), df, check_freq=False)
+
+    for factor in (2, 3, 4):
+        backend.save(df * factor)
+        pd.testing.assert_frame_equal(backend.load(), df * factor, check_freq=False)
+
+    # The pointer file, the current version and the previous one are kept
+    assert len(list(backend.path.iterdir())) == 3
+    assert backend.load_watermark() == df.index[-1]
+
+def test_parquet_load_empty(tmp_path):
+
+    backend = store.BackendParquet(tmp_path / "expanded")
+    backend.save(get_hourly("2020-01-15", 24 * 10))
+
+    # No partition in the dates, as with sqlite : the columns and an empty DatetimeIndex
+    for df in (backend.load(start="2021-01-01"), backend.load(start="2021-01-01", columns=["b"])):
+        assert df.empty and isinstance(df.index, pd.DatetimeIndex) and df.index.name == "longdate"
+
+    assert list(backend.load(start="2021-01-01").columns) == ["a", "b"]
+    assert list(backend.load(start="2021-01-01", columns=["b"], dtype="float32").dtypes) == ["float32"]
+
+    # Same columns and index as the sqlite backend
+    backend_sql = store.BackendSql(tmp_path / "expanded.db")
+    backend_sql.save(get_hourly("2020-01-15", 24 * 10))
+
+    pd.testing.assert_frame_equal(backend.load(start="2021-01-01"), backend_sql.load(start="2021-01-01"), check_dtype=False)